@@ -0,0 +1,41 @@
+import asyncio
+import os
+import time
+
+from db import db
+from services_incidents import INCIDENT_STATUSES, incident_stats_pipeline
+
+ADMIN_STATS_TTL_SECONDS = float(os.environ.get("ADMIN_STATS_TTL_SECONDS", "5"))
+_stats_cache: dict = {"expires_at": 0.0, "value": None}
+_stats_lock = asyncio.Lock()
+
+
+async def _compute_stats() -> dict:
+    incident_counts, subscribers, resources = await asyncio.gather(
+        db.incidents.aggregate(incident_stats_pipeline()).to_list(1),
+        db.subscribers.count_documents({"active": True}),
+        db.resources.count_documents({}),
+    )
+    empty = {"total": 0, **{status: 0 for status in INCIDENT_STATUSES}, "critical": 0}
+    return {
+        "incidents": {**empty, **(incident_counts[0] if incident_counts else {})},
+        "subscribers": subscribers,
+        "resources": resources,
+    }
+
+
+async def get_admin_stats() -> dict:
+    """Dashboard counts, shared by all admins for ``ADMIN_STATS_TTL_SECONDS``."""
+    if _stats_cache["value"] is not None and _stats_cache["expires_at"] > time.monotonic():
+        return _stats_cache["value"]
+    async with _stats_lock:
+        # Concurrent refreshes wait for the first one instead of repeating it.
+        if _stats_cache["value"] is None or _stats_cache["expires_at"] <= time.monotonic():
+            _stats_cache["value"] = await _compute_stats()
+            _stats_cache["expires_at"] = time.monotonic() + ADMIN_STATS_TTL_SECONDS
+    return _stats_cache["value"]
+
+
+def invalidate_admin_stats() -> None:
+    """Refresh the counts on the next read; called whenever an incident's status changes."""
+    _stats_cache["expires_at"] = 0.0
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+
+from db import db
+from outbox import email_outbox
+from services_incidents import incident_location
+
+logger = logging.getLogger(__name__)
+
+MAX_SUBSCRIBER_RADIUS_KM = 500
+
+_dispatch_tasks: set[asyncio.Task] = set()
+
+
+def alert_triggers() -> set[str]:
+    raw = os.environ.get("ALERT_TRIGGERS", "verified")
+    return {t.strip().lower() for t in raw.split(",") if t.strip()}
+
+
+async def backfill_subscriber_locations() -> None:
+    """Give subscribers stored before the 2dsphere index a GeoJSON ``location``."""
+    await db.subscribers.update_many(
+        {
+            "location": {"$exists": False},
+            "latitude": {"$type": "number"},
+            "longitude": {"$type": "number"},
+        },
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}],
+    )
+
+
+def subscriber_location(latitude: float | None, longitude: float | None) -> dict | None:
+    if latitude is None or longitude is None:
+        return None
+    return incident_location(latitude, longitude)
+
+
+async def find_subscribers_near(lat: float, lng: float) -> list[dict]:
+    """Active subscribers whose own ``radius_km`` covers the point."""
+    pipeline = [
+        {
+            "$geoNear": {
+                "near": incident_location(lat, lng),
+                "distanceField": "distance_m",
+                "maxDistance": MAX_SUBSCRIBER_RADIUS_KM * 1000,
+                "query": {"active": True},
+                "spherical": True,
+            }
+        },
+        {"$match": {"$expr": {"$lte": ["$distance_m", {"$multiply": ["$radius_km", 1000]}]}}},
+        {"$project": {"_id": 0, "id": 1, "name": 1, "email": 1, "distance_m": 1}},
+    ]
+    return await db.subscribers.aggregate(pipeline).to_list(None)
+
+
+def _alert_email(subscriber: dict, incident: dict) -> dict:
+    distance_km = subscriber["distance_m"] / 1000
+    severity = incident.get("severity", "unknown")
+    status = incident.get("verification_status", "unverified")
+    return {
+        # One alert per subscriber and incident, however often it is re-verified.
+        "dedup_key": f"alert:{subscriber['id']}:{incident.get('id')}",
+        "to_email": subscriber["email"],
+        "to_name": subscriber.get("name", ""),
+        "subject": f"SafeGuard Alert: {severity} incident {distance_km:.1f} km away",
+        "body": (
+            f"Hello {subscriber.get('name', '')},\n\n"
+            f"A {severity}-severity incident ({status}) was reported "
+            f"{distance_km:.1f} km from your alert location.\n\n"
+            f"Time: {incident.get('datetime', '')}\n"
+            f"Location: {incident.get('lat')}, {incident.get('lng')}\n"
+            f"Details: {incident.get('description') or 'No description provided'}\n\n"
+            "Stay safe,\n"
+            "SafeGuard Team"
+        ),
+    }
+
+
+async def dispatch_incident_alerts(incident: dict) -> int:
+    subscribers = await find_subscribers_near(incident["lat"], incident["lng"])
+    queued = await email_outbox.enqueue_many(
+        [_alert_email(subscriber, incident) for subscriber in subscribers]
+    )
+    if queued:
+        logger.info("Queued %s alerts for incident %s", queued, incident.get("id"))
+    return queued
+
+
+async def _dispatch_safely(incident: dict) -> None:
+    try:
+        await dispatch_incident_alerts(incident)
+    except Exception as e:
+        logger.error("Alert dispatch failed for incident %s: %s", incident.get("id"), e)
+
+
+def schedule_incident_alerts(incident: dict, trigger: str) -> None:
+    """Match subscribers in the background so the request returns immediately."""
+    if trigger not in alert_triggers():
+        return
+    task = asyncio.create_task(_dispatch_safely(incident))
+    _dispatch_tasks.add(task)
+    task.add_done_callback(_dispatch_tasks.discard)
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+# Incidents are grouped into regions of REGION_CELL_DEG x REGION_CELL_DEG degrees,
+# named by their south-west corner, e.g. "10:30".
+REGION_CELL_DEG = 10
+INTERVALS = {
+    "hour": ("incident_rollups_hourly", "%Y-%m-%dT%H"),
+    "day": ("incident_rollups_daily", "%Y-%m-%d"),
+}
+GROUP_FIELDS = ("severity", "status", "region")
+MAX_HOURLY_RANGE = timedelta(days=92)
+
+
+def region_key(lat: float, lng: float) -> str:
+    return (
+        f"{math.floor(lat / REGION_CELL_DEG) * REGION_CELL_DEG}:"
+        f"{math.floor(lng / REGION_CELL_DEG) * REGION_CELL_DEG}"
+    )
+
+
+def _incident_time(incident: dict) -> datetime:
+    moment = datetime.fromisoformat(incident["datetime"])
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def _bucket_start(moment: datetime, interval: str) -> datetime:
+    if interval == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rollup_update(incident: dict, status: str, delta: int, interval: str) -> UpdateOne:
+    bucket = _bucket_start(_incident_time(incident), interval)
+    region = region_key(incident["lat"], incident["lng"])
+    severity = incident.get("severity", "medium")
+    key = f"{bucket.strftime(INTERVALS[interval][1])}|{severity}|{status}|{region}"
+    return UpdateOne(
+        {"_id": key},
+        {
+            "$inc": {"count": delta},
+            "$setOnInsert": {"bucket": bucket, "severity": severity, "status": status, "region": region},
+        },
+        upsert=True,
+    )
+
+
+async def record_incident_change(incident: dict, old_status: str | None, new_status: str | None) -> None:
+    """Move one incident between rollup cells; a None status means it was created or removed.
+
+    Rollups can always be rebuilt from ``db.incidents``, so failures are logged rather
+    than failing the request that changed the incident.
+    """
+    if old_status == new_status:
+        return
+    try:
+        writes = []
+        for interval, (collection, _) in INTERVALS.items():
+            updates = []
+            if old_status is not None:
+                updates.append(_rollup_update(incident, old_status, -1, interval))
+            if new_status is not None:
+                updates.append(_rollup_update(incident, new_status, 1, interval))
+            writes.append(db[collection].bulk_write(updates, ordered=False))
+        await asyncio.gather(*writes)
+    except Exception as e:
+        logger.error("Rollup update failed for incident %s: %s", incident.get("id"), e)
+
+
+def _rebuild_pipeline(output: str) -> list[dict]:
+    def region_part(field: str) -> dict:
+        cell = {"$multiply": [{"$floor": {"$divide": [f"${field}", REGION_CELL_DEG]}}, REGION_CELL_DEG]}
+        return {"$toString": {"$toInt": cell}}
+
+    return [
+        {"$match": {"datetime": {"$type": "string"}, "lat": {"$type": "number"}, "lng": {"$type": "number"}}},
+        {
+            "$group": {
+                "_id": {
+                    "bucket": {"$dateTrunc": {"date": {"$dateFromString": {"dateString": "$datetime"}}, "unit": "hour"}},
+                    "severity": {"$ifNull": ["$severity", "medium"]},
+                    "status": {"$ifNull": ["$verification_status", "unverified"]},
+                    "region": {"$concat": [region_part("lat"), ":", region_part("lng")]},
+                },
+                "count": {"$sum": 1},
+            }
+        },
+        {"$replaceWith": {"$mergeObjects": ["$_id", {"count": "$count"}]}},
+        {"$out": output},
+    ]
+
+
+def _regroup_pipeline(interval: str, output: str) -> list[dict]:
+    fmt = INTERVALS[interval][1]
+    bucket = {"$dateTrunc": {"date": "$bucket", "unit": interval}}
+    return [
+        {
+            "$group": {
+                "_id": {"bucket": bucket, "severity": "$severity", "status": "$status", "region": "$region"},
+                "count": {"$sum": "$count"},
+            }
+        },
+        {
+            "$replaceWith": {
+                "$mergeObjects": [
+                    "$_id",
+                    {
+                        "count": "$count",
+                        "_id": {
+                            "$concat": [
+                                {"$dateToString": {"format": fmt, "date": "$_id.bucket"}},
+                                "|", "$_id.severity", "|", "$_id.status", "|", "$_id.region",
+                            ]
+                        },
+                    },
+                ]
+            }
+        },
+        {"$out": output},
+    ]
+
+
+async def rebuild_rollups() -> None:
+    """Recompute every rollup collection from ``db.incidents``.
+
+    Counts go to a staging collection first; ``$out`` then swaps each rollup in
+    atomically, so readers never see a half-built series. Increments made while
+    the rebuild runs may be lost; rebuild again in a quiet period if that matters.
+    """
+    staging = "incident_rollups_staging"
+    await db.incidents.aggregate(_rebuild_pipeline(staging)).to_list(None)
+    for interval, (collection, _) in INTERVALS.items():
+        # $out keeps the indexes of the collection it replaces.
+        await db[staging].aggregate(_regroup_pipeline(interval, collection)).to_list(None)
+    await db[staging].drop()
+
+
+async def ensure_rollups() -> None:
+    """Build rollups once for databases that have incidents but no rollups yet."""
+    collection = INTERVALS["day"][0]
+    if await db[collection].find_one({}) is None and await db.incidents.find_one({}) is not None:
+        logger.info("Building incident rollups from existing incidents")
+        await rebuild_rollups()
+
+
+def _parse_bound(raw: str | None, name: str) -> datetime | None:
+    if not raw:
+        return None
+    try:
+        moment = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def build_series_pipeline(
+    interval: str = "day",
+    since: str | None = None,
+    until: str | None = None,
+    group_by: str | None = None,
+    severity: str | None = None,
+    status: str | None = None,
+    region: str | None = None,
+) -> list[dict]:
+    """Aggregation over a rollup collection; raises ``ValueError`` on bad input."""
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of: {', '.join(INTERVALS)}")
+    if group_by is not None and group_by not in GROUP_FIELDS:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_FIELDS)}")
+    until_dt = _parse_bound(until, "until") or datetime.now(timezone.utc)
+    since_dt = _parse_bound(since, "since") or until_dt - timedelta(days=30)
+    if since_dt > until_dt:
+        raise ValueError("since must be before until")
+    if interval == "hour" and until_dt - since_dt > MAX_HOURLY_RANGE:
+        raise ValueError("Hourly series are limited to 92 days; use interval=day")
+
+    match = {"bucket": {"$gte": _bucket_start(since_dt.astimezone(timezone.utc), interval), "$lte": until_dt}}
+    for field, value in (("severity", severity), ("status", status), ("region", region)):
+        if value:
+            match[field] = {"$in": [v.strip() for v in value.split(",") if v.strip()]}
+    group_id = {"bucket": "$bucket"}
+    if group_by:
+        group_id[group_by] = f"${group_by}"
+    return [
+        {"$match": match},
+        {"$group": {"_id": group_id, "count": {"$sum": "$count"}}},
+        {"$match": {"count": {"$gt": 0}}},
+        {"$sort": {"_id.bucket": 1}},
+    ]
+
+
+def format_series_point(group: dict) -> dict:
+    point = dict(group["_id"])
+    bucket = point["bucket"]
+    if bucket.tzinfo is None:
+        bucket = bucket.replace(tzinfo=timezone.utc)
+    point["bucket"] = bucket.isoformat()
+    point["count"] = group["count"]
+    return point
+
+
+async def incident_series(interval: str = "day", **filters) -> list[dict]:
+    pipeline = build_series_pipeline(interval, **filters)
+    groups = await db[INTERVALS[interval][0]].aggregate(pipeline).to_list(None)
+    return [format_series_point(group) for group in groups]
@@ -1,4 +1,6 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import bcrypt
@@ -6,9 +8,24 @@ import jwt
 from bson import ObjectId
 from fastapi import HTTPException, Request
 
+from config import env_bool
 from db import db
+from user_cache import create_user_cache
 
 JWT_ALGORITHM = "HS256"
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+BCRYPT_MAX_WORKERS = int(os.environ.get("BCRYPT_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop.
+# The semaphore makes excess callers wait on the loop, where a disconnected client's
+# request can still be cancelled before it costs a hash.
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_slots: asyncio.Semaphore | None = None
+
+# In stateless mode the signed role/name claims are trusted and users are never
+# looked up; a role change then takes effect when the user's token is renewed.
+AUTH_STATELESS = env_bool("AUTH_STATELESS", default=False)
+user_cache = create_user_cache()
 
 
 def get_jwt_secret():
@@ -16,17 +33,43 @@ def get_jwt_secret():
 
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(BCRYPT_ROUNDS)).decode("utf-8")
 
 
 def verify_password(plain: str, hashed: str) -> bool:
     return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
 
 
-def create_access_token(user_id: str, email: str) -> str:
+def password_needs_rehash(hashed: str) -> bool:
+    """True when ``hashed`` was made with a different cost than ``BCRYPT_ROUNDS``."""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+async def _run_bcrypt(func, *args):
+    global _bcrypt_slots
+    if _bcrypt_slots is None:
+        _bcrypt_slots = asyncio.Semaphore(BCRYPT_MAX_WORKERS)
+    async with _bcrypt_slots:
+        return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, func, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_bcrypt(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await _run_bcrypt(verify_password, plain, hashed)
+
+
+def create_access_token(user_id: str, email: str, role: str = "user", name: str = "") -> str:
     payload = {
         "sub": user_id,
         "email": email,
+        "role": role,
+        "name": name,
         "exp": datetime.now(timezone.utc) + timedelta(hours=24),
         "type": "access",
     }
@@ -42,24 +85,61 @@ def create_refresh_token(user_id: str) -> str:
     return jwt.encode(payload, get_jwt_secret(), algorithm=JWT_ALGORITHM)
 
 
-async def get_current_user(request: Request) -> dict:
+def _request_token(request: Request) -> str | None:
     token = request.cookies.get("access_token")
     if not token:
         auth_header = request.headers.get("Authorization", "")
         if auth_header.startswith("Bearer "):
             token = auth_header[7:]
+    return token
+
+
+def invalidate_user(user_id: str | None = None) -> None:
+    """Drop a cached user (or all users) after a password, role or session change."""
+    user_cache.invalidate(user_id)
+
+
+def logout_user(request: Request) -> None:
+    token = _request_token(request)
+    if not token:
+        return
+    try:
+        payload = jwt.decode(
+            token, get_jwt_secret(), algorithms=[JWT_ALGORITHM], options={"verify_exp": False}
+        )
+    except jwt.InvalidTokenError:
+        return
+    invalidate_user(payload.get("sub"))
+
+
+async def _load_user(user_id: str) -> dict:
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"password_hash": 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    user["_id"] = str(user["_id"])
+    user_cache.put(user_id, user)
+    return user
+
+
+async def get_current_user(request: Request) -> dict:
+    token = _request_token(request)
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
         payload = jwt.decode(token, get_jwt_secret(), algorithms=[JWT_ALGORITHM])
         if payload.get("type") != "access":
             raise HTTPException(status_code=401, detail="Invalid token type")
-        user = await db.users.find_one({"_id": ObjectId(payload["sub"])})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        user["_id"] = str(user["_id"])
-        user.pop("password_hash", None)
-        return user
+        if AUTH_STATELESS and "role" in payload:
+            return {
+                "_id": payload["sub"],
+                "email": payload.get("email", ""),
+                "name": payload.get("name", ""),
+                "role": payload["role"],
+            }
+        return await _load_user(payload["sub"])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
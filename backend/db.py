@@ -11,7 +11,18 @@ async def ensure_indexes() -> None:
     await db.users.create_index("email", unique=True)
     await db.incidents.create_index("id", unique=True)
     await db.incidents.create_index([("datetime", -1)])
+    await db.incidents.create_index([("datetime", -1), ("id", -1)])
+    await db.incidents.create_index([("verification_status", 1), ("datetime", -1), ("id", -1)])
     await db.incidents.create_index("verification_status")
+    await db.incidents.create_index([("location", "2dsphere")])
+    await db.incidents.create_index("change_seq")
     await db.subscribers.create_index("email", unique=True)
+    await db.subscribers.create_index([("location", "2dsphere")])
+    await db.files.create_index("id", unique=True)
+    await db.files.create_index("sha256")
     await db.flags.create_index([("incident_id", 1), ("created_at", -1)])
+    await db.incident_rollups_hourly.create_index("bucket")
+    await db.incident_rollups_daily.create_index("bucket")
 
+    await db.ai_tasks.create_index("expires_at", expireAfterSeconds=0)
+    await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from config import env_bool
+from db import db
+
+logger = logging.getLogger(__name__)
+
+
+def render_json(content) -> bytes:
+    # Same encoding as starlette's JSONResponse, so cached and uncached bodies match.
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class FeedCache:
+    """Serialized responses of the public incident feed, keyed by query string.
+
+    Entries are tagged with the feed version they were built from; any
+    incident mutation bumps the version. With ``shared=True`` the version
+    also lives in ``db.counters`` so writes on one worker invalidate every
+    worker's copy (polled at most every ``poll_seconds``).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 30,
+        shared: bool = False,
+        poll_seconds: float = 1.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self.poll_seconds = poll_seconds
+        self._local_version = 0
+        self._shared_version = 0
+        self._shared_checked_at = 0.0
+        self._entries: OrderedDict[str, tuple[float, str, bytes, str, dict]] = OrderedDict()
+
+    async def version(self) -> str:
+        if self.shared and time.monotonic() - self._shared_checked_at >= self.poll_seconds:
+            try:
+                counter = await db.counters.find_one({"_id": "incident_feed"})
+                self._shared_version = counter["seq"] if counter else 0
+                self._shared_checked_at = time.monotonic()
+            except Exception as e:
+                logger.warning("Feed cache version check failed: %s", e)
+        return f"{self._local_version}.{self._shared_version}"
+
+    def get(self, key: str, version: str) -> tuple[bytes, str, dict] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, entry_version, body, etag, headers = entry
+        if entry_version != version or expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return body, etag, headers
+
+    def put(self, key: str, version: str, body: bytes, headers: dict) -> str:
+        etag = etag_for(body)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, version, body, etag, headers)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return etag
+
+    async def invalidate(self) -> None:
+        self._local_version += 1
+        self._entries.clear()
+        if self.shared:
+            try:
+                await db.counters.update_one({"_id": "incident_feed"}, {"$inc": {"seq": 1}}, upsert=True)
+            except Exception as e:
+                logger.error("Feed cache shared invalidation failed: %s", e)
+
+
+incident_feed_cache = FeedCache(
+    max_entries=int(os.environ.get("FEED_CACHE_MAX_ENTRIES", "256")),
+    ttl_seconds=float(os.environ.get("FEED_CACHE_TTL_SECONDS", "30")),
+    shared=env_bool("FEED_CACHE_SHARED", default=False),
+)
+
+
+async def invalidate_incident_feed() -> None:
+    await incident_feed_cache.invalidate()
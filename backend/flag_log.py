@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+from collections import deque
+
+from pymongo.errors import BulkWriteError
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+
+class FlagLog:
+    """Best-effort append-only log of incident flags, written in batches by a background task.
+
+    ``flag_count`` on the incident is the authoritative count; this log only
+    records what was flagged and why. Records wait in memory until
+    ``batch_size`` accumulate or ``flush_seconds`` pass, then go out in one
+    unordered ``insert_many``. A failed batch is retried on the next flush, and
+    the buffer is flushed on shutdown. Beyond ``max_buffered`` pending records
+    the oldest are dropped with a warning, and a crash loses whatever is buffered.
+    """
+
+    def __init__(self, collection, batch_size: int = 200, flush_seconds: float = 1, max_buffered: int = 10_000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max_buffered
+        self._pending: deque[dict] = deque()
+        self.dropped = 0
+        self._full: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def append(self, record: dict) -> None:
+        if len(self._pending) >= self.max_buffered:
+            dropped = self._pending.popleft()
+            self.dropped += 1
+            logger.warning(
+                "Flag log buffer full (%s records); dropped flag for incident %s (%s dropped so far)",
+                self.max_buffered,
+                dropped.get("incident_id"),
+                self.dropped,
+            )
+        self._pending.append(record)
+        if self._full is not None and len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def clear(self) -> None:
+        """Drop buffered records, e.g. when the flags they refer to are wiped."""
+        self._pending.clear()
+
+    async def flush(self) -> int:
+        """Write everything buffered so far; returns how many records were stored."""
+        written = 0
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # insert_many assigned each record an _id, so records stored by an
+                # earlier partial attempt come back as duplicates and are done.
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    self._pending.extendleft(reversed(batch))
+                    raise
+                written += e.details["nInserted"]
+                continue
+            except BaseException:
+                self._pending.extendleft(reversed(batch))
+                raise
+            written += len(batch)
+        return written
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Flag log flush failed: %s", e)
+
+    async def start(self) -> None:
+        if self._worker is not None:
+            return
+        self._full = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._full = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Flag log flush on shutdown failed, %s records lost: %s", len(self._pending), e)
+
+
+def create_flag_log() -> FlagLog:
+    return FlagLog(
+        db.flags,
+        batch_size=int(os.environ.get("FLAG_LOG_BATCH_SIZE", "200")),
+        flush_seconds=float(os.environ.get("FLAG_LOG_FLUSH_SECONDS", "1")),
+    )
+
+
+flag_log = create_flag_log()
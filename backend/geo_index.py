@@ -0,0 +1,100 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat: float, lng: float, radius_km: float) -> tuple[float, float, float, float]:
+    """Bounding box ``(min_lng, min_lat, max_lng, max_lat)`` of a circle; may wrap the antimeridian."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return -180.0, max(min_lat, -90.0), 180.0, min(max_lat, 90.0)
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+    if dlng >= 180:
+        return -180.0, min_lat, 180.0, max_lat
+    min_lng, max_lng = lng - dlng, lng + dlng
+    if min_lng < -180:
+        min_lng += 360
+    if max_lng > 180:
+        max_lng -= 360
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def bbox_contains(bbox: tuple[float, float, float, float], lat: float, lng: float) -> bool:
+    min_lng, min_lat, max_lng, max_lat = bbox
+    if not (min_lat <= lat <= max_lat):
+        return False
+    if min_lng <= max_lng:
+        return min_lng <= lng <= max_lng
+    return lng >= min_lng or lng <= max_lng
+
+
+class GridIndex:
+    """Fixed-degree grid mapping cells to the keys whose bounding boxes cover them.
+
+    Boxes spanning more than ``max_cells`` cells are kept in a separate list
+    that every lookup returns, so huge regions do not bloat the grid.
+    """
+
+    def __init__(self, cell_deg: float = 1.0, max_cells: int = 1024):
+        self.cell_deg = cell_deg
+        self.max_cells = max_cells
+        self._cells: dict[tuple[int, int], set] = {}
+        self._wide: set = set()
+        self._key_cells: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._key_cells)
+
+    def _cell(self, lat: float, lng: float) -> tuple[int, int]:
+        return int((lng + 180) // self.cell_deg), int((lat + 90) // self.cell_deg)
+
+    def _cells_for(self, bbox) -> list[tuple[int, int]] | None:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        spans = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+        y0, y1 = self._cell(min_lat, 0)[1], self._cell(max_lat, 0)[1]
+        count = sum(
+            (self._cell(0, hi)[0] - self._cell(0, lo)[0] + 1) * (y1 - y0 + 1) for lo, hi in spans
+        )
+        if count > self.max_cells:
+            return None
+        cells = []
+        for lo, hi in spans:
+            for x in range(self._cell(0, lo)[0], self._cell(0, hi)[0] + 1):
+                cells.extend((x, y) for y in range(y0, y1 + 1))
+        return cells
+
+    def add(self, key, bbox) -> None:
+        self.remove(key)
+        cells = self._cells_for(bbox)
+        if cells is None:
+            self._wide.add(key)
+        else:
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(key)
+        self._key_cells[key] = cells
+
+    def remove(self, key) -> None:
+        if key not in self._key_cells:
+            return
+        cells = self._key_cells.pop(key)
+        if cells is None:
+            self._wide.discard(key)
+            return
+        for cell in cells:
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._cells[cell]
+
+    def candidates(self, lat: float, lng: float) -> set:
+        return self._cells.get(self._cell(lat, lng), set()) | self._wide
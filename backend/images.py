@@ -0,0 +1,63 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each served variant.
+VARIANTS = {"thumb": 256, "medium": 1024}
+VARIANT_CONTENT_TYPE = "image/webp"
+WEBP_QUALITY = 80
+# Uploads are capped at 10 MB, but a small file can still decode to a huge bitmap.
+Image.MAX_IMAGE_PIXELS = 40_000_000
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def render_variants(data: bytes) -> dict[str, bytes]:
+    """Encode every variant of an image as WebP, without EXIF or other metadata.
+
+    Runs in a worker process: decoding and resizing are CPU bound.
+    """
+    largest = max(VARIANTS.values())
+    with Image.open(io.BytesIO(data)) as source:
+        # JPEG can decode at a reduced scale, which is much cheaper than a full decode.
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    rendered = {}
+    for name, edge in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=WEBP_QUALITY, method=4)
+        rendered[name] = out.getvalue()
+    return rendered
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # By now the server has Motor, bcrypt and to_thread threads; forking it could
+        # hand a worker a lock held by one of them, so workers start from a clean server.
+        _pool = ProcessPoolExecutor(
+            max_workers=int(os.environ.get("IMAGE_WORKERS", "2")),
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _pool
+
+
+async def generate_variants(data: bytes) -> dict[str, bytes]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), render_variants, data)
+
+
+def shutdown_image_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,6 +1,9 @@
 import logging
+import os
 from pathlib import Path
 
+from knowledge_index import format_sections, get_index
+
 logger = logging.getLogger(__name__)
 BASE_DIR = Path(__file__).parent
 
@@ -19,16 +22,16 @@ def load_knowledge_files(directory: str):
     return "\n\n".join(content)
 
 
-GENERAL_KNOWLEDGE = load_knowledge_files("knowledge")
-FIRST_AID_KNOWLEDGE = load_knowledge_files("knowledge/first_aid")
-EMERGENCY_PROCEDURES_CONTENT = ""
-FIRST_AID_CONTENT = ""
+def first_aid_content() -> str:
+    """The first-aid offline pack, read from disk when requested."""
+    return load_knowledge_files("knowledge/first_aid")
+
+
+def emergency_procedures_content() -> str:
+    """The emergency-procedures offline pack, read from disk when requested."""
+    ep_file = BASE_DIR / "knowledge" / "emergency_procedures.md"
+    return ep_file.read_text(encoding="utf-8") if ep_file.exists() else ""
 
-_ep_file = BASE_DIR / "knowledge" / "emergency_procedures.md"
-if _ep_file.exists():
-    EMERGENCY_PROCEDURES_CONTENT = _ep_file.read_text(encoding="utf-8")
-if FIRST_AID_KNOWLEDGE:
-    FIRST_AID_CONTENT = FIRST_AID_KNOWLEDGE
 
 EMERGENCY_NUMBERS = {
     "sudan": {"ambulance": "+249183777777", "police": "+249183777778", "red_crescent": "+249183777779", "icrc": "+41227346001", "display_name": "Sudan"},
@@ -51,10 +54,10 @@ EMERGENCY_NUMBERS = {
 }
 
 AGENT_SYSTEM_MESSAGES = {
-    "general": f"""You are a humanitarian crisis assistance agent for SafeGuard, providing safety information to people in conflict zones worldwide.
+    "general": """You are a humanitarian crisis assistance agent for SafeGuard, providing safety information to people in conflict zones worldwide.
 
 KNOWLEDGE BASE:
-{GENERAL_KNOWLEDGE}
+{knowledge}
 
 CAPABILITIES:
 - Emergency procedures for shelling, gunfire, evacuation
@@ -78,10 +81,10 @@ LIMITATIONS:
 - Do not speculate on future conflict developments
 
 Respond with practical, immediately actionable information.""",
-    "medical": f"""You are a medical first-aid agent for SafeGuard crisis zones.
+    "medical": """You are a medical first-aid agent for SafeGuard crisis zones.
 
 FIRST AID KNOWLEDGE BASE:
-{FIRST_AID_KNOWLEDGE}
+{knowledge}
 
 CAPABILITIES:
 - First-aid for bleeding, burns, shock, trauma, blast injuries
@@ -152,3 +155,55 @@ RESPONSE FORMAT:
 City coordinates: Khartoum: 15.5, 32.5 | Gaza: 31.5, 34.4 | Kyiv: 50.4, 30.5 | Sana'a: 15.35, 44.2 | Damascus: 33.51, 36.29 | Kabul: 34.53, 69.17 | Mogadishu: 2.05, 45.32""",
 }
 
+
+# Agents whose prompts carry a "{knowledge}" slot, mapped to the directory they retrieve from.
+AGENT_KNOWLEDGE_SCOPES = {
+    "general": "knowledge",
+    "medical": "knowledge/first_aid",
+}
+KNOWLEDGE_PLACEHOLDER = "{knowledge}"
+
+
+def _agent_int_setting(name: str, agent_type: str, default: int) -> int:
+    raw = os.environ.get(f"{name}_{agent_type.upper()}", os.environ.get(name, ""))
+    try:
+        return int(raw) if str(raw).strip() else default
+    except ValueError:
+        return default
+
+
+def retrieve_knowledge(agent_type: str, query: str) -> str:
+    scope = AGENT_KNOWLEDGE_SCOPES.get(agent_type)
+    if not scope:
+        return ""
+    top_k = _agent_int_setting("KNOWLEDGE_TOP_K", agent_type, 6)
+    token_budget = _agent_int_setting("KNOWLEDGE_TOKEN_BUDGET", agent_type, 2000)
+    sections = get_index(scope).search(query, top_k)
+    if not sections:
+        return "(No knowledge base sections matched this request.)"
+    return format_sections(sections, token_budget)
+
+
+def build_system_prompt(agent_type: str, query: str) -> str:
+    template = AGENT_SYSTEM_MESSAGES.get(agent_type, AGENT_SYSTEM_MESSAGES["general"])
+    if KNOWLEDGE_PLACEHOLDER not in template:
+        return template
+    scoped_agent = agent_type if agent_type in AGENT_KNOWLEDGE_SCOPES else "general"
+    return template.replace(KNOWLEDGE_PLACEHOLDER, retrieve_knowledge(scoped_agent, query))
+
+
+def refresh_knowledge(agent_type: str) -> None:
+    scope = AGENT_KNOWLEDGE_SCOPES.get(agent_type)
+    if scope:
+        get_index(scope).refresh()
+
+
+def on_knowledge_change(agent_type: str, callback) -> None:
+    scope = AGENT_KNOWLEDGE_SCOPES.get(agent_type)
+    if scope:
+        get_index(scope).on_change(callback)
+
+
+def warm_knowledge_indexes() -> None:
+    for scope in AGENT_KNOWLEDGE_SCOPES.values():
+        get_index(scope).refresh()
@@ -0,0 +1,229 @@
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+BASE_DIR = Path(__file__).parent
+
+MAX_CHUNK_CHARS = 1800
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_HEADING_RE = re.compile(r"^(#{1,3})\s+(.*)$")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do for from has have how i if in into is it its me my "
+    "no not of on or our so than that the their them then there these they this to up "
+    "was we what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic shared by English BPE tokenizers: ~4 characters per token.
+    return max(1, len(text) // 4)
+
+
+def _split_long(text: str, limit: int) -> list[str]:
+    if len(text) <= limit:
+        return [text]
+    pieces, current = [], ""
+    for para in re.split(r"\n\s*\n", text):
+        if current and len(current) + len(para) + 2 > limit:
+            pieces.append(current)
+            current = para
+        else:
+            current = f"{current}\n\n{para}" if current else para
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_markdown(name: str, text: str) -> list[dict]:
+    """Split a markdown document into heading-scoped sections."""
+    title = name
+    sections: list[tuple[str, list[str]]] = []
+    heading, lines = "", []
+    for line in text.splitlines():
+        match = _HEADING_RE.match(line)
+        if match and len(match.group(1)) <= 2:
+            if lines and any(ln.strip() for ln in lines):
+                sections.append((heading, lines))
+            if len(match.group(1)) == 1:
+                title, heading = match.group(2).strip(), ""
+            else:
+                heading = match.group(2).strip()
+            lines = []
+            continue
+        lines.append(line)
+    if lines and any(ln.strip() for ln in lines):
+        sections.append((heading, lines))
+
+    chunks = []
+    for heading, body_lines in sections:
+        label = f"{title} > {heading}" if heading else title
+        body = "\n".join(body_lines).strip()
+        for piece in _split_long(body, MAX_CHUNK_CHARS):
+            chunks.append({"source": name, "heading": label, "text": piece})
+    return chunks
+
+
+class KnowledgeIndex:
+    """BM25 index over the markdown files of one knowledge directory.
+
+    The index is rebuilt whenever the directory's file signature (names,
+    sizes and mtimes) changes; listeners registered with ``on_change`` are
+    notified after each rebuild.
+    """
+
+    def __init__(self, directory: str, cache_path: Path | None = None):
+        self.directory = BASE_DIR / directory
+        self.cache_path = cache_path
+        self.signature: list | None = None
+        self.chunks: list[dict] = []
+        self._doc_freqs: list[Counter] = []
+        self._idf: dict[str, float] = {}
+        self._avg_len = 0.0
+        self._listeners: list = []
+
+    def on_change(self, callback) -> None:
+        self._listeners.append(callback)
+
+    def _files(self) -> list[Path]:
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.md"))
+
+    def _current_signature(self) -> list:
+        sig = []
+        for path in self._files():
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            sig.append([path.name, st.st_size, st.st_mtime_ns])
+        return sig
+
+    def _load_cached_chunks(self, signature: list) -> list[dict] | None:
+        if not self.cache_path or not self.cache_path.exists():
+            return None
+        try:
+            cached = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning("Ignoring unreadable knowledge index cache %s: %s", self.cache_path, e)
+            return None
+        if cached.get("signature") != signature:
+            return None
+        return cached.get("chunks")
+
+    def _store_cached_chunks(self, signature: list, chunks: list[dict]) -> None:
+        if not self.cache_path:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(
+                json.dumps({"signature": signature, "chunks": chunks}), encoding="utf-8"
+            )
+        except Exception as e:
+            logger.warning("Could not write knowledge index cache %s: %s", self.cache_path, e)
+
+    def refresh(self) -> bool:
+        """Rebuild the index if the underlying files changed. Returns True on rebuild."""
+        signature = self._current_signature()
+        if signature == self.signature:
+            return False
+
+        chunks = self._load_cached_chunks(signature)
+        if chunks is None:
+            chunks = []
+            for md_file in self._files():
+                try:
+                    text = md_file.read_text(encoding="utf-8")
+                except Exception as e:
+                    logger.error("Failed to load %s: %s", md_file, e)
+                    continue
+                chunks.extend(chunk_markdown(md_file.name, text))
+            self._store_cached_chunks(signature, chunks)
+
+        doc_freqs = [Counter(tokenize(f"{c['heading']}\n{c['text']}")) for c in chunks]
+        df: Counter = Counter()
+        for freqs in doc_freqs:
+            df.update(freqs.keys())
+        n = len(chunks)
+        self._idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+        self._doc_freqs = doc_freqs
+        self._avg_len = (sum(sum(f.values()) for f in doc_freqs) / n) if n else 0.0
+        self.chunks = chunks
+        first_build = self.signature is None
+        self.signature = signature
+        logger.info("Knowledge index for %s built: %s chunks", self.directory.name, n)
+        if not first_build:
+            for callback in self._listeners:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error("Knowledge change listener failed: %s", e)
+        return True
+
+    def _score(self, query_terms: list[str], idx: int) -> float:
+        freqs = self._doc_freqs[idx]
+        length = sum(freqs.values())
+        score = 0.0
+        for term in query_terms:
+            tf = freqs.get(term)
+            if not tf:
+                continue
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (self._avg_len or 1))
+            score += self._idf.get(term, 0.0) * tf * (BM25_K1 + 1) / norm
+        return score
+
+    def search(self, query: str, top_k: int) -> list[dict]:
+        self.refresh()
+        terms = tokenize(query)
+        if not terms or not self.chunks:
+            return []
+        scored = [(self._score(terms, i), i) for i in range(len(self.chunks))]
+        scored = [s for s in scored if s[0] > 0]
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [{**self.chunks[i], "score": score} for score, i in scored[:top_k]]
+
+
+def format_sections(sections: list[dict], token_budget: int) -> str:
+    """Render retrieved sections, stopping once the token budget is spent."""
+    parts, used = [], 0
+    for section in sections:
+        block = f"--- {section['source']} :: {section['heading']} ---\n{section['text']}"
+        cost = estimate_tokens(block)
+        if parts and used + cost > token_budget:
+            break
+        if not parts and cost > token_budget:
+            block = block[: token_budget * 4]
+            cost = token_budget
+        parts.append(block)
+        used += cost
+    return "\n\n".join(parts)
+
+
+def _cache_path_for(directory: str) -> Path | None:
+    cache_dir = os.environ.get("KNOWLEDGE_INDEX_CACHE_DIR", "").strip()
+    if not cache_dir:
+        return None
+    return Path(cache_dir) / f"{directory.replace('/', '_')}.json"
+
+
+_indexes: dict[str, KnowledgeIndex] = {}
+
+
+def get_index(directory: str) -> KnowledgeIndex:
+    index = _indexes.get(directory)
+    if index is None:
+        index = KnowledgeIndex(directory, cache_path=_cache_path_for(directory))
+        _indexes[directory] = index
+    return index
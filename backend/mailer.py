@@ -1,29 +1,100 @@
 import logging
 import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 import mailtrap as mt
 
 logger = logging.getLogger(__name__)
 
 
-def send_alert_email(to_email: str, to_name: str, subject: str, body: str) -> tuple[bool, str]:
-    token = os.environ.get("MAILTRAP_TOKEN")
-    if not token:
-        logger.warning("MAILTRAP_TOKEN not set, email not sent")
-        return False, "MAILTRAP_TOKEN not configured"
-    try:
-        mail = mt.Mail(
-            sender=mt.Address(email="hello@demomailtrap.co", name="SafeGuard Alerts"),
-            to=[mt.Address(email=to_email, name=to_name)],
-            subject=subject,
-            text=body,
-            category="SafeGuard Alert",
-        )
-        client = mt.MailtrapClient(token=token)
-        response = client.send(mail)
-        logger.info("Email sent to %s: %s", to_email, response)
+class MailTransport(ABC):
+    """Delivers already-rendered emails. ``send_batch`` is blocking; callers run it in a thread."""
+
+    name = ""
+    # Emails of one batch in flight at once; 1 sends them in order.
+    max_concurrency = 1
+
+    @abstractmethod
+    def send(self, to_email: str, to_name: str, subject: str, body: str) -> tuple[bool, str]: ...
+
+    def send_batch(self, mails: list[dict]) -> list[tuple[bool, str]]:
+        if self.max_concurrency <= 1 or len(mails) <= 1:
+            return [self.send(**mail) for mail in mails]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(mails))) as pool:
+            return list(pool.map(lambda mail: self.send(**mail), mails))
+
+
+class MailtrapTransport(MailTransport):
+    name = "mailtrap"
+
+    def __init__(self):
+        self.token = os.environ.get("MAILTRAP_TOKEN")
+        self.max_concurrency = int(os.environ.get("MAILTRAP_MAX_CONCURRENCY", "8"))
+        self._client: mt.MailtrapClient | None = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self) -> mt.MailtrapClient:
+        # One client for the life of the process instead of one per email.
+        with self._client_lock:
+            if self._client is None:
+                self._client = mt.MailtrapClient(token=self.token)
+        return self._client
+
+    def send(self, to_email: str, to_name: str, subject: str, body: str) -> tuple[bool, str]:
+        if not self.token:
+            logger.warning("MAILTRAP_TOKEN not set, email not sent")
+            return False, "MAILTRAP_TOKEN not configured"
+        try:
+            mail = mt.Mail(
+                sender=mt.Address(email="hello@demomailtrap.co", name="SafeGuard Alerts"),
+                to=[mt.Address(email=to_email, name=to_name)],
+                subject=subject,
+                text=body,
+                category="SafeGuard Alert",
+            )
+            response = self._get_client().send(mail)
+            logger.info("Email sent to %s: %s", to_email, response)
+            return True, "sent"
+        except Exception as e:
+            logger.error("Email send failed: %s", e)
+            return False, str(e)
+
+
+class FakeTransport(MailTransport):
+    """Records emails instead of sending them; ``fail_with`` makes every send fail."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.sent: list[dict] = []
+        self.fail_with: str | None = None
+
+    def send(self, to_email: str, to_name: str, subject: str, body: str) -> tuple[bool, str]:
+        if self.fail_with:
+            return False, self.fail_with
+        self.sent.append({"to_email": to_email, "to_name": to_name, "subject": subject, "body": body})
         return True, "sent"
-    except Exception as e:
-        logger.error("Email send failed: %s", e)
-        return False, str(e)
 
+
+TRANSPORT_CLASSES = {
+    MailtrapTransport.name: MailtrapTransport,
+    FakeTransport.name: FakeTransport,
+}
+_transport: MailTransport | None = None
+
+
+def get_mail_transport() -> MailTransport:
+    global _transport
+    if _transport is None:
+        name = os.environ.get("MAIL_TRANSPORT", "mailtrap").strip().lower()
+        if name not in TRANSPORT_CLASSES:
+            raise ValueError(f"Unsupported MAIL_TRANSPORT '{name}'. Supported: mailtrap, fake")
+        _transport = TRANSPORT_CLASSES[name]()
+    return _transport
+
+
+def set_mail_transport(transport: MailTransport | None) -> None:
+    global _transport
+    _transport = transport
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from db import db
+from mailer import get_mail_transport
+
+logger = logging.getLogger(__name__)
+
+MAIL_FIELDS = ("to_email", "to_name", "subject", "body")
+
+
+class EmailOutbox:
+    """Durable email queue stored in MongoDB and drained by a background worker.
+
+    Each email has a ``dedup_key`` with a unique index, so the same alert is
+    never queued twice. The worker claims a batch in bulk under a lease token
+    (crashed workers' claims expire), sends it through the shared mail transport
+    in a thread, and reschedules failures with exponential backoff until
+    ``max_attempts`` is reached. Delivered and failed records are kept for
+    ``retention_days`` so dedup keeps working, then removed by a TTL index.
+    """
+
+    def __init__(
+        self,
+        collection,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 30,
+        retry_max_seconds: float = 3600,
+        poll_seconds: float = 5,
+        lease_seconds: float = 120,
+        retention_days: float = 30,
+    ):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.retention = timedelta(days=retention_days)
+        self.worker_id = uuid.uuid4().hex
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("dedup_key", unique=True)
+        await self.collection.create_index([("status", 1), ("next_attempt_at", 1)])
+        await self.collection.create_index("purge_at", expireAfterSeconds=0)
+        await self.collection.create_index("lease", sparse=True)
+
+    def _record(self, mail: dict, now: datetime) -> dict:
+        return {
+            "dedup_key": mail["dedup_key"],
+            **{field: mail[field] for field in MAIL_FIELDS},
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+
+    async def enqueue(self, mail: dict) -> bool:
+        """Queue one email; returns False if its ``dedup_key`` was already queued."""
+        try:
+            await self.collection.insert_one(self._record(mail, datetime.now(timezone.utc)))
+        except DuplicateKeyError:
+            return False
+        self._notify()
+        return True
+
+    async def enqueue_many(self, mails: list[dict]) -> int:
+        """Queue several emails in one round trip; returns how many were new."""
+        if not mails:
+            return 0
+        now = datetime.now(timezone.utc)
+        try:
+            result = await self.collection.insert_many(
+                [self._record(mail, now) for mail in mails], ordered=False
+            )
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+            inserted = e.details.get("nInserted", 0)
+        if inserted:
+            self._notify()
+        return inserted
+
+    def _notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def claim_batch(self) -> list[dict]:
+        now = datetime.now(timezone.utc)
+        claimable = {
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lte": now}},
+            ]
+        }
+        candidates = (
+            await self.collection.find(claimable, {"_id": 1})
+            .sort("next_attempt_at", 1)
+            .limit(self.batch_size)
+            .to_list(self.batch_size)
+        )
+        if not candidates:
+            return []
+        token = uuid.uuid4().hex
+        lease = {
+            "status": "sending",
+            "lease_until": now + timedelta(seconds=self.lease_seconds),
+            "worker": self.worker_id,
+            "lease": token,
+        }
+        # Repeating the claimable filter leaves out anything another worker claimed
+        # since the find; the token then picks out exactly what this call won.
+        await self.collection.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in candidates]}, **claimable}, {"$set": lease}
+        )
+        return await self.collection.find({"lease": token}).sort("next_attempt_at", 1).to_list(None)
+
+    async def process_batch(self) -> int:
+        """Send one claimed batch; returns the number of emails attempted."""
+        batch = await self.claim_batch()
+        if not batch:
+            return 0
+        mails = [{field: doc[field] for field in MAIL_FIELDS} for doc in batch]
+        transport = get_mail_transport()
+        # Mail clients are blocking; keep them off the event loop.
+        results = await asyncio.to_thread(transport.send_batch, mails)
+        await self._record_results(batch, results)
+        return len(batch)
+
+    async def _record_results(self, batch: list[dict], results: list[tuple[bool, str]]) -> None:
+        now = datetime.now(timezone.utc)
+        updates = []
+        failed = 0
+        for doc, (sent, status) in zip(batch, results):
+            if sent:
+                change = {"status": "sent", "sent_at": now, "purge_at": now + self.retention}
+            else:
+                failed += 1
+                attempts = doc.get("attempts", 0) + 1
+                change = {"attempts": attempts, "last_error": status}
+                if attempts >= self.max_attempts:
+                    change.update(status="failed", purge_at=now + self.retention)
+                else:
+                    retry_at = now + timedelta(seconds=self.retry_delay(attempts))
+                    change.update(status="pending", next_attempt_at=retry_at)
+            unset = {"lease_until": "", "worker": "", "lease": ""}
+            updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": change, "$unset": unset}))
+        await self.collection.bulk_write(updates, ordered=False)
+        if failed:
+            logger.warning("%s of %s queued emails failed", failed, len(batch))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self.process_batch():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Email outbox worker failed: %s", e)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        if self._worker is not None:
+            return
+        await self.ensure_indexes()
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._wakeup = None
+
+
+def create_email_outbox() -> EmailOutbox:
+    return EmailOutbox(
+        db.email_outbox,
+        batch_size=int(os.environ.get("OUTBOX_BATCH_SIZE", "50")),
+        max_attempts=int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5")),
+        retry_base_seconds=float(os.environ.get("OUTBOX_RETRY_BASE_SECONDS", "30")),
+        poll_seconds=float(os.environ.get("OUTBOX_POLL_SECONDS", "5")),
+    )
+
+
+email_outbox = create_email_outbox()
@@ -0,0 +1,98 @@
+import base64
+import json
+
+INCIDENT_FIELDS = (
+    "id",
+    "datetime",
+    "lat",
+    "lng",
+    "description",
+    "severity",
+    "source",
+    "image",
+    "image_file_id",
+    "verification_status",
+    "created_at",
+    "change_seq",
+)
+# Moderators review flagged incidents, so the admin listing also carries flag_count.
+ADMIN_INCIDENT_FIELDS = (*INCIDENT_FIELDS, "flag_count")
+INCIDENT_SORT = [("datetime", -1), ("id", -1)]
+COUNT_MODES = ("exact", "estimated", "none")
+ESTIMATED_COUNT_CAP = 10000
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["datetime"], doc["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        dt, incident_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(dt, str) or not isinstance(incident_id, int):
+            raise ValueError
+        return dt, incident_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(cursor: str) -> dict:
+    """Match documents strictly after ``cursor`` in (datetime desc, id desc) order."""
+    dt, incident_id = decode_cursor(cursor)
+    return {"$or": [{"datetime": {"$lt": dt}}, {"datetime": dt, "id": {"$lt": incident_id}}]}
+
+
+def parse_fields(raw: str | None, admin: bool = False) -> list[str] | None:
+    if not raw:
+        return None
+    allowed = ADMIN_INCIDENT_FIELDS if admin else INCIDENT_FIELDS
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    invalid = [f for f in fields if f not in allowed]
+    if invalid or not fields:
+        raise ValueError(f"Invalid fields. Allowed: {', '.join(allowed)}")
+    return fields
+
+
+def incident_projection(fields: list[str] | None, admin: bool = False) -> dict:
+    if fields is None:
+        if admin:
+            return {"_id": 0, "location": 0, "changed_at": 0}
+        # flag_count changes on every flag without invalidating cached feed pages.
+        return {"_id": 0, "location": 0, "changed_at": 0, "flag_count": 0}
+    # The sort keys are always fetched so the next cursor can be built.
+    return {"_id": 0, **{f: 1 for f in {*fields, "id", "datetime"}}}
+
+
+async def fetch_incident_page(
+    collection,
+    query: dict,
+    limit: int,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    admin: bool = False,
+) -> tuple[list[dict], str | None]:
+    if cursor:
+        query = {"$and": [query, keyset_filter(cursor)]} if query else keyset_filter(cursor)
+    docs = (
+        await collection.find(query, incident_projection(fields, admin=admin))
+        .sort(INCIDENT_SORT)
+        .limit(limit)
+        .to_list(limit)
+    )
+    next_cursor = encode_cursor(docs[-1]) if len(docs) == limit else None
+    if fields is not None:
+        docs = [{k: v for k, v in doc.items() if k in fields} for doc in docs]
+    return docs, next_cursor
+
+
+async def count_incidents(collection, query: dict, mode: str) -> int | None:
+    if mode == "none":
+        return None
+    if mode == "estimated":
+        if not query:
+            return await collection.estimated_document_count()
+        return await collection.count_documents(query, limit=ESTIMATED_COUNT_CAP)
+    return await collection.count_documents(query)
+
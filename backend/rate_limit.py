@@ -1,12 +1,163 @@
+import logging
+import math
+import os
+import re
 import time
-from collections import defaultdict, deque
-from threading import Lock
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
 
 from fastapi import Request
 from fastapi.responses import JSONResponse
 
-_bucket_lock = Lock()
-_buckets: dict[str, deque[float]] = defaultdict(deque)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    method: str
+    path: re.Pattern
+    key: str
+    limit: int
+    window_seconds: int
+    message: str
+
+
+def _rule(method: str, path: str, key: str, limit: int, window_seconds: int, message: str):
+    return RateLimitRule(method, re.compile(f"{path}/?"), key, limit, window_seconds, message)
+
+
+RATE_LIMIT_RULES = [
+    _rule("POST", r"/api/auth/login", "auth_login", 10, 900, "Login rate limit exceeded (10/15min)."),
+    _rule("POST", r"/api/ai/chat(/stream)?", "ai_chat", 5, 3600, "AI chat rate limit exceeded (5/hour)."),
+    _rule("POST", r"/api/seed", "seed_data", 3, 3600, "Seed rate limit exceeded (3/hour)."),
+    _rule("POST", r"/api/upload", "upload_file", 20, 3600, "Upload rate limit exceeded (20/hour)."),
+    _rule(
+        "POST", r"/api/incidents/[^/]+/flag", "flag_incident", 10, 3600, "Flag rate limit exceeded (10/hour)."
+    ),
+    _rule("POST", r"/api/report", "report_incident", 5, 3600, "Report rate limit exceeded (5/hour)."),
+    _rule("POST", r"/api/subscribe", "subscribe", 5, 3600, "Subscription rate limit exceeded (5/hour)."),
+]
+
+
+def match_rule(method: str, path: str, rules: list[RateLimitRule] = RATE_LIMIT_RULES):
+    for rule in rules:
+        if rule.method == method and rule.path.fullmatch(path):
+            return rule
+    return None
+
+
+def gcra_params(limit: int, window_seconds: float) -> tuple[float, float]:
+    """Emission interval and burst tolerance that never admit more than ``limit`` per window.
+
+    Half of ``limit`` (rounded up) may arrive at once and the rest are spread over
+    the window, so no rolling window ever sees more than ``limit`` requests.
+    """
+    burst = math.ceil(limit / 2)
+    interval = window_seconds / (limit - burst + 1)
+    return interval, (burst - 1) * interval
+
+
+def gcra(tat: float | None, now: float, limit: int, window_seconds: float) -> tuple[bool, float, float]:
+    """One step of the generic cell rate algorithm.
+
+    ``tat`` is the key's theoretical arrival time, the only state kept per key.
+    Returns ``(allowed, new_tat, retry_after)``; see ``gcra_params`` for the rate.
+    """
+    interval, tolerance = gcra_params(limit, window_seconds)
+    tat = max(tat if tat is not None else now, now)
+    if tat - now > tolerance:
+        return False, tat, tat - now - tolerance
+    return True, tat + interval, 0.0
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    async def hit(self, key: str, limit: int, window_seconds: float) -> tuple[bool, float]:
+        """Record one request for ``key``; returns ``(allowed, retry_after_seconds)``."""
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Per-process GCRA state: one float per key, idle keys evicted."""
+
+    def __init__(self, max_keys: int = 100_000, sweep_seconds: float = 60):
+        self.max_keys = max_keys
+        self.sweep_seconds = sweep_seconds
+        self._tats: OrderedDict[str, float] = OrderedDict()
+        self._next_sweep = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def _evict(self, now: float) -> None:
+        if now >= self._next_sweep:
+            # A key whose TAT has passed is indistinguishable from a new one.
+            for key in [k for k, tat in self._tats.items() if tat <= now]:
+                del self._tats[key]
+            self._next_sweep = now + self.sweep_seconds
+        while len(self._tats) >= self.max_keys:
+            self._tats.popitem(last=False)
+
+    async def hit(self, key: str, limit: int, window_seconds: float) -> tuple[bool, float]:
+        now = time.time()
+        allowed, tat, retry_after = gcra(self._tats.get(key), now, limit, window_seconds)
+        if allowed:
+            if key not in self._tats:
+                self._evict(now)
+            self._tats[key] = tat
+            self._tats.move_to_end(key)
+        return allowed, retry_after
+
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """GCRA state shared by every worker, updated atomically in one round trip.
+
+    A TTL index on ``expires_at`` removes keys once they have gone idle.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def hit(self, key: str, limit: int, window_seconds: float) -> tuple[bool, float]:
+        from pymongo import ReturnDocument
+
+        now = time.time()
+        interval, tolerance = gcra_params(limit, window_seconds)
+        tat = {"$max": [{"$ifNull": ["$tat", now]}, now]}
+        allowed = {"$lte": [{"$subtract": ["$tat", now]}, tolerance]}
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tat": tat}},
+                {"$set": {"allowed": allowed}},
+                {
+                    "$set": {
+                        "tat": {"$cond": ["$allowed", {"$add": ["$tat", interval]}, "$tat"]},
+                    }
+                },
+                {"$set": {"expires_at": {"$toDate": {"$multiply": ["$tat", 1000]}}}},
+            ],
+            upsert=True,
+            projection={"tat": 1, "allowed": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return True, 0.0
+        return False, doc["tat"] - now - tolerance
+
+
+def create_rate_limit_backend() -> RateLimitBackend:
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "memory").strip().lower()
+    if backend == "mongo":
+        from db import db
+
+        return MongoRateLimitBackend(db.rate_limits)
+    if backend != "memory":
+        raise ValueError(f"Unsupported RATE_LIMIT_BACKEND '{backend}'. Supported: memory, mongo")
+    return MemoryRateLimitBackend(max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")))
+
+
+rate_limiter = create_rate_limit_backend()
 
 
 def _client_ip(request: Request) -> str:
@@ -16,20 +167,35 @@ def _client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
-def check_rate_limit(request: Request, key: str, limit: int, window_seconds: int) -> bool:
-    """Return True when request is within limit, False when exceeded."""
-    now = time.time()
-    bucket_key = f"{key}:{_client_ip(request)}"
-    with _bucket_lock:
-        bucket = _buckets[bucket_key]
-        cutoff = now - window_seconds
-        while bucket and bucket[0] < cutoff:
-            bucket.popleft()
-        if len(bucket) >= limit:
-            return False
-        bucket.append(now)
-    return True
-
-
 def rate_limit_response(message: str = "Too many requests. Please try again later.") -> JSONResponse:
     return JSONResponse(content={"status": "error", "message": message}, status_code=429)
+
+
+class RateLimitMiddleware:
+    """Applies ``RATE_LIMIT_RULES`` per client IP before the request body is read."""
+
+    def __init__(self, app, backend: RateLimitBackend | None = None, rules: list[RateLimitRule] | None = None):
+        self.app = app
+        self.backend = backend
+        self.rules = RATE_LIMIT_RULES if rules is None else rules
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rule = match_rule(scope["method"], scope["path"], self.rules)
+        if rule is not None:
+            backend = self.backend if self.backend is not None else rate_limiter
+            key = f"{rule.key}:{_client_ip(Request(scope))}"
+            try:
+                allowed, retry_after = await backend.hit(key, rule.limit, rule.window_seconds)
+            except Exception as e:
+                # Fail open: an unavailable limiter backend must not take the API down.
+                logger.error("Rate limiter unavailable: %s", e)
+                allowed, retry_after = True, 0.0
+            if not allowed:
+                response = rate_limit_response(rule.message)
+                response.headers["Retry-After"] = str(max(1, round(retry_after)))
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -1,30 +1,251 @@
+import asyncio
+import json
+import logging
+import os
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 
+from geo_index import GridIndex, bbox_contains, haversine_km, radius_bbox
+from realtime_bus import BroadcastBus, InProcessBus, create_broadcast_bus
+from services_incidents import SEVERITY_RANK
+
+logger = logging.getLogger(__name__)
+
+RESYNC_MESSAGE = json.dumps({"type": "resync_required"})
+
+
+class SubscriptionFilter:
+    """Region (bbox or circle) and minimum severity a socket wants events for."""
+
+    def __init__(
+        self,
+        bbox: tuple[float, float, float, float] | None = None,
+        center: tuple[float, float] | None = None,
+        radius_km: float | None = None,
+        min_severity: str | None = None,
+    ):
+        self.bbox = bbox
+        self.center = center
+        self.radius_km = radius_km
+        self.min_rank = SEVERITY_RANK.get(min_severity, 0)
+
+    @classmethod
+    def from_message(cls, data: dict) -> "SubscriptionFilter":
+        """Parse a ``subscribe`` message; raises ``ValueError`` on bad input."""
+        bbox = center = radius_km = None
+        if data.get("bbox") is not None:
+            try:
+                min_lng, min_lat, max_lng, max_lat = (float(v) for v in data["bbox"])
+            except (TypeError, ValueError):
+                raise ValueError("bbox must be [minLng, minLat, maxLng, maxLat]")
+            if not (-90 <= min_lat <= max_lat <= 90) or not all(
+                -180 <= v <= 180 for v in (min_lng, max_lng)
+            ):
+                raise ValueError("Invalid bbox")
+            bbox = (min_lng, min_lat, max_lng, max_lat)
+        elif data.get("center") is not None:
+            try:
+                lat, lng = (float(v) for v in data["center"])
+                radius_km = float(data.get("radius_km", 0))
+            except (TypeError, ValueError):
+                raise ValueError("center must be [lat, lng] with a numeric radius_km")
+            if not (-90 <= lat <= 90) or not (-180 <= lng <= 180) or not (0 < radius_km <= 20000):
+                raise ValueError("Invalid center or radius_km")
+            center = (lat, lng)
+        min_severity = data.get("min_severity")
+        if min_severity is not None and min_severity not in SEVERITY_RANK:
+            raise ValueError("Invalid min_severity")
+        return cls(bbox=bbox, center=center, radius_km=radius_km, min_severity=min_severity)
+
+    def region(self) -> tuple[float, float, float, float] | None:
+        if self.bbox is not None:
+            return self.bbox
+        if self.center is not None:
+            return radius_bbox(self.center[0], self.center[1], self.radius_km)
+        return None
+
+    def matches(self, lat: float, lng: float, severity: str | None) -> bool:
+        if severity is not None and SEVERITY_RANK.get(severity, 0) < self.min_rank:
+            return False
+        if self.bbox is not None:
+            return bbox_contains(self.bbox, lat, lng)
+        if self.center is not None:
+            return haversine_km(self.center[0], self.center[1], lat, lng) <= self.radius_km
+        return True
+
+
+def _event_location(message: dict) -> tuple[float, float, str | None] | None:
+    """Where an event happened, or None for events every socket must receive."""
+    incident = message.get("incident") or message
+    lat, lng = incident.get("lat"), incident.get("lng")
+    if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+        return None
+    # Removals are delivered regardless of severity: the client may be showing the incident.
+    severity = incident.get("severity") if message.get("type") != "incident_removed" else None
+    return lat, lng, severity
+
+
+class _Subscriber:
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue)
+        self.writer: asyncio.Task | None = None
+        self.coalesced = 0
+        self.filter: SubscriptionFilter | None = None
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    """Fans incident events out to WebSocket clients without blocking the publisher.
+
+    Each event is serialized once and queued per connection; a writer task per
+    connection drains its queue. When a slow client's queue overflows, its
+    backlog is replaced by a single ``resync_required`` message (clients then
+    catch up through ``/api/incidents/changes``). Clients whose sends stall
+    longer than ``send_timeout`` are disconnected.
+
+    ``broadcast`` goes through a ``BroadcastBus`` so events published on one
+    worker reach sockets attached to every worker.
+
+    Sockets may narrow their feed with ``subscribe``; regional subscriptions
+    live in a ``GridIndex`` so an event is only matched against sockets whose
+    region covers it, plus sockets without a region.
+    """
+
+    def __init__(self, max_queue: int = 64, send_timeout: float = 10.0):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.subscribers: dict[WebSocket, _Subscriber] = {}
+        self._unfiltered: set[WebSocket] = set()
+        self._regions = GridIndex(cell_deg=1.0, max_cells=4096)
+        self.bus: BroadcastBus = InProcessBus()
+        self.bus.attach(self.publish)
+
+    async def start(self, bus: BroadcastBus | None = None):
+        if bus is not None:
+            self.bus = bus
+            self.bus.attach(self.publish)
+        await self.bus.start()
+
+    async def stop(self):
+        await self.bus.stop()
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.subscribers)
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        subscriber = _Subscriber(websocket, self.max_queue)
+        subscriber.writer = asyncio.create_task(self._write_loop(subscriber))
+        self.subscribers[websocket] = subscriber
+        self._unfiltered.add(websocket)
+
+    def subscribe(self, websocket: WebSocket, subscription: SubscriptionFilter | None):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return
+        subscriber.filter = subscription
+        self._regions.remove(websocket)
+        self._unfiltered.discard(websocket)
+        region = subscription.region() if subscription else None
+        if region is None:
+            self._unfiltered.add(websocket)
+        else:
+            self._regions.add(websocket, region)
+
+    def send(self, websocket: WebSocket, message: dict):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is not None:
+            self._enqueue(subscriber, json.dumps(message))
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self._regions.remove(websocket)
+        self._unfiltered.discard(websocket)
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber and subscriber.writer and subscriber.writer is not asyncio.current_task():
+            subscriber.writer.cancel()
 
-    async def broadcast(self, message: dict):
-        dead = []
-        for connection in self.active_connections:
+    async def _write_loop(self, subscriber: _Subscriber):
+        websocket = subscriber.websocket
+        try:
+            while True:
+                text = await subscriber.queue.get()
+                await asyncio.wait_for(websocket.send_text(text), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("Dropping WebSocket client: %s", e or type(e).__name__)
+            self.disconnect(websocket)
             try:
-                await connection.send_json(message)
+                await websocket.close(code=1011)
             except Exception:
-                dead.append(connection)
-        for conn in dead:
-            self.disconnect(conn)
+                pass
+
+    def _enqueue(self, subscriber: _Subscriber, text: str):
+        try:
+            subscriber.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            # Coalesce the backlog: the client resyncs instead of replaying stale events.
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(RESYNC_MESSAGE)
+            subscriber.coalesced += 1
+
+    def publish(self, message: dict):
+        """Queue ``message`` for every connection; never awaits a client."""
+        text = json.dumps(message)
+        location = _event_location(message)
+        if location is None:
+            targets = list(self.subscribers.values())
+        else:
+            lat, lng, severity = location
+            sockets = self._regions.candidates(lat, lng) | self._unfiltered
+            targets = []
+            for websocket in sockets:
+                subscriber = self.subscribers.get(websocket)
+                if subscriber is None:
+                    continue
+                if subscriber.filter is None or subscriber.filter.matches(lat, lng, severity):
+                    targets.append(subscriber)
+        for subscriber in targets:
+            self._enqueue(subscriber, text)
 
+    async def broadcast(self, message: dict):
+        await self.bus.publish(message)
+
+
+ws_manager = ConnectionManager(
+    max_queue=int(os.environ.get("WS_SEND_QUEUE_SIZE", "64")),
+    send_timeout=float(os.environ.get("WS_SEND_TIMEOUT_SECONDS", "10")),
+)
+
+
+def _handle_client_message(websocket: WebSocket, text: str) -> None:
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(data, dict):
+        return
+    if data.get("type") == "subscribe":
+        try:
+            subscription = SubscriptionFilter.from_message(data)
+        except ValueError as e:
+            ws_manager.send(websocket, {"type": "error", "message": str(e)})
+            return
+        ws_manager.subscribe(websocket, subscription)
+        ws_manager.send(websocket, {"type": "subscribed"})
+    elif data.get("type") == "unsubscribe":
+        ws_manager.subscribe(websocket, None)
+        ws_manager.send(websocket, {"type": "subscribed"})
+
+
+async def start_realtime() -> None:
+    await ws_manager.start(create_broadcast_bus())
 
-ws_manager = ConnectionManager()
+
+async def stop_realtime() -> None:
+    await ws_manager.stop()
 
 
 def register_websocket(app: FastAPI) -> None:
@@ -33,7 +254,8 @@ def register_websocket(app: FastAPI) -> None:
         await ws_manager.connect(websocket)
         try:
             while True:
-                await websocket.receive_text()
+                _handle_client_message(websocket, await websocket.receive_text())
         except WebSocketDisconnect:
+            pass
+        finally:
             ws_manager.disconnect(websocket)
-
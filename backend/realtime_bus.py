@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+REPLAY_WINDOW = timedelta(seconds=5)
+SEEN_IDS_LIMIT = 4096
+
+
+class BroadcastBus(ABC):
+    """Carries realtime events to every worker; each worker fans them out locally."""
+
+    def __init__(self):
+        self._deliver = None
+
+    def attach(self, deliver) -> None:
+        """Set the local fan-out callback that receives every event."""
+        self._deliver = deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def publish(self, message: dict) -> None: ...
+
+
+class InProcessBus(BroadcastBus):
+    """Single-worker bus: events only reach sockets attached to this process."""
+
+    async def publish(self, message: dict) -> None:
+        if self._deliver is not None:
+            self._deliver(message)
+
+
+class MongoBus(BroadcastBus):
+    """Relays events between workers through a capped collection.
+
+    Every worker tails the collection with a tailable cursor, which works on a
+    standalone mongod (change streams would require a replica set). Events
+    published by this worker are delivered locally right away and skipped
+    when they come back through the tail.
+    """
+
+    def __init__(
+        self, database, collection_name: str = "realtime_events", size_bytes: int = 16 * 1024 * 1024
+    ):
+        super().__init__()
+        self.database = database
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.origin = uuid.uuid4().hex
+        self._tail_task: asyncio.Task | None = None
+
+    @property
+    def collection(self):
+        return self.database[self.collection_name]
+
+    async def _ensure_collection(self) -> None:
+        from pymongo.errors import CollectionInvalid
+
+        try:
+            await self.database.create_collection(
+                self.collection_name, capped=True, size=self.size_bytes
+            )
+        except CollectionInvalid:
+            options = await self.collection.options()
+            if not options.get("capped"):
+                raise RuntimeError(f"{self.collection_name} exists but is not a capped collection")
+
+    async def start(self) -> None:
+        await self._ensure_collection()
+        if await self.collection.find_one({}) is None:
+            # A tailable cursor on an empty capped collection dies immediately.
+            await self.collection.insert_one({"origin": self.origin, "message": None})
+        self._tail_task = asyncio.create_task(self._tail())
+
+    async def stop(self) -> None:
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            try:
+                await self._tail_task
+            except asyncio.CancelledError:
+                pass
+            self._tail_task = None
+
+    async def _tail(self) -> None:
+        from bson import ObjectId
+        from pymongo import CursorType
+
+        # ObjectIds from different workers are not ordered within the same second,
+        # so each (re)opened cursor starts a little before the newest event seen
+        # and already-delivered ids are skipped.
+        since = ObjectId.from_datetime(datetime.now(timezone.utc))
+        seen: OrderedDict = OrderedDict()
+        while True:
+            try:
+                cursor = self.collection.find(
+                    {"_id": {"$gte": since}}, cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    async for doc in cursor:
+                        if doc["_id"] in seen:
+                            continue
+                        seen[doc["_id"]] = None
+                        if len(seen) > SEEN_IDS_LIMIT:
+                            seen.popitem(last=False)
+                        replay_from = doc["_id"].generation_time - REPLAY_WINDOW
+                        since = max(since, ObjectId.from_datetime(replay_from))
+                        if doc.get("origin") != self.origin and doc.get("message") is not None:
+                            self._deliver(doc["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Realtime bus tail failed, retrying: %s", e)
+            await asyncio.sleep(0.5)
+
+    async def publish(self, message: dict) -> None:
+        self._deliver(message)
+        try:
+            await self.collection.insert_one({"origin": self.origin, "message": message})
+        except Exception as e:
+            logger.error("Realtime bus publish failed: %s", e)
+
+
+def create_broadcast_bus() -> BroadcastBus:
+    backend = os.environ.get("REALTIME_BUS", "inprocess").strip().lower()
+    if backend == "mongo":
+        from db import db
+
+        size_bytes = int(os.environ.get("REALTIME_BUS_CAPPED_BYTES", str(16 * 1024 * 1024)))
+        return MongoBus(db, size_bytes=size_bytes)
+    if backend != "inprocess":
+        raise ValueError(f"Unsupported REALTIME_BUS '{backend}'. Supported: inprocess, mongo")
+    return InProcessBus()
@@ -0,0 +1,77 @@
+import os
+import time
+from collections import OrderedDict
+
+from config import env_bool
+
+
+def normalize_message(message: str) -> tuple[str, ...]:
+    # Every word is kept: dropping "not" or "no" would turn a question into its opposite.
+    return tuple(message.lower().split())
+
+
+class ResponseCache:
+    """LRU cache of AI responses keyed by agent type and normalised message.
+
+    For most agents the key is the message's sorted words, so the same words in
+    another order hit. Agents in ``exact_agents`` keep word order.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        exact_agents: frozenset[str] = frozenset({"medical"}),
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.exact_agents = exact_agents
+        self._entries: OrderedDict[tuple[str, tuple[str, ...]], tuple[float, str]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _key(self, agent_type: str, message: str) -> tuple[str, tuple[str, ...]] | None:
+        words = normalize_message(message)
+        if not words:
+            return None
+        return agent_type, words if agent_type in self.exact_agents else tuple(sorted(words))
+
+    def get(self, agent_type: str, message: str) -> str | None:
+        key = self._key(agent_type, message)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, agent_type: str, message: str, content: str) -> None:
+        key = self._key(agent_type, message)
+        if key is None:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, agent_type: str | None = None) -> None:
+        if agent_type is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if k[0] == agent_type]:
+            del self._entries[key]
+
+
+def create_response_cache() -> ResponseCache | None:
+    if not env_bool("AI_CACHE_ENABLED", default=True):
+        return None
+    return ResponseCache(
+        max_entries=int(os.environ.get("AI_CACHE_MAX_ENTRIES", "1000")),
+        ttl_seconds=float(os.environ.get("AI_CACHE_TTL_SECONDS", "3600")),
+        exact_agents=frozenset(
+            a.strip() for a in os.environ.get("AI_CACHE_EXACT_AGENTS", "medical").split(",") if a.strip()
+        ),
+    )
@@ -1,8 +1,23 @@
+
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
 
+from admin_stats import get_admin_stats, invalidate_admin_stats
+from alerts import schedule_incident_alerts
+from analytics import incident_series, rebuild_rollups, record_incident_change
 from auth import require_admin
 from db import db
+from feed_cache import invalidate_incident_feed
+from pagination import (
+    COUNT_MODES,
+    INCIDENT_SORT,
+    count_incidents,
+    fetch_incident_page,
+    incident_projection,
+    parse_fields,
+)
 from realtime import ws_manager
+from services_incidents import next_change
 
 router = APIRouter(prefix="/api")
 
@@ -10,74 +25,143 @@ router = APIRouter(prefix="/api")
 @router.get("/admin/stats")
 async def admin_stats(request: Request):
     await require_admin(request)
-    total = await db.incidents.count_documents({})
-    unverified = await db.incidents.count_documents({"verification_status": "unverified"})
-    verified = await db.incidents.count_documents({"verification_status": "verified"})
-    flagged = await db.incidents.count_documents({"verification_status": "flagged"})
-    rejected = await db.incidents.count_documents({"verification_status": "rejected"})
-    critical = await db.incidents.count_documents({"severity": "critical"})
-    subscribers = await db.subscribers.count_documents({"active": True})
-    resources = await db.resources.count_documents({})
-    return {
-        "incidents": {
-            "total": total,
-            "unverified": unverified,
-            "verified": verified,
-            "flagged": flagged,
-            "rejected": rejected,
-            "critical": critical,
-        },
-        "subscribers": subscribers,
-        "resources": resources,
-    }
+    return await get_admin_stats()
 
 
 @router.get("/admin/incidents")
 async def admin_get_incidents(
-    request: Request, status: str | None = None, limit: int = 50, offset: int = 0
+    request: Request,
+    status: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: str | None = None,
+    fields: str | None = None,
+    count: str | None = None,
 ):
     await require_admin(request)
     query = {}
     if status:
         query["verification_status"] = status
-    incidents = (
-        await db.incidents.find(query, {"_id": 0})
-        .sort("datetime", -1)
-        .skip(offset)
-        .limit(limit)
-        .to_list(limit)
-    )
-    total = await db.incidents.count_documents(query)
-    return {"incidents": incidents, "total": total}
+    limit = max(1, min(limit, 200))
+    # Counting is only needed for the first page unless the caller asks otherwise.
+    count_mode = count or ("exact" if not cursor and not offset else "none")
+    if count_mode not in COUNT_MODES:
+        return JSONResponse(
+            content={"error": f"Invalid count. Must be one of: {', '.join(COUNT_MODES)}"},
+            status_code=400,
+        )
+    try:
+        projection_fields = parse_fields(fields, admin=True)
+        if offset and not cursor:
+            # Legacy offset paging; prefer the cursor returned as next_cursor.
+            incidents = (
+                await db.incidents.find(query, incident_projection(projection_fields, admin=True))
+                .sort(INCIDENT_SORT)
+                .skip(offset)
+                .limit(limit)
+                .to_list(limit)
+            )
+            next_cursor = None
+        else:
+            incidents, next_cursor = await fetch_incident_page(
+                db.incidents, query, limit, cursor=cursor, fields=projection_fields, admin=True
+            )
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    total = await count_incidents(db.incidents, query, count_mode)
+    return {"incidents": incidents, "total": total, "next_cursor": next_cursor}
 
 
 @router.put("/admin/incidents/{incident_id}/verify")
 async def admin_verify_incident(request: Request, incident_id: int):
     await require_admin(request)
-    result = await db.incidents.update_one(
-        {"id": incident_id}, {"$set": {"verification_status": "verified"}}
+    changes = {"verification_status": "verified", **await next_change()}
+    # The previous status is needed to move the incident between rollup cells.
+    incident = await db.incidents.find_one_and_update(
+        {"id": incident_id}, {"$set": changes}, projection={"_id": 0, "location": 0}
     )
-    if result.matched_count == 0:
+    if incident is None:
         raise HTTPException(status_code=404, detail="Incident not found")
-    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
+    await invalidate_incident_feed()
+    invalidate_admin_stats()
+    await record_incident_change(incident, incident.get("verification_status"), "verified")
+    incident.update(changes)
+    incident.pop("changed_at")
     await ws_manager.broadcast({"type": "incident_updated", "incident": incident})
+    schedule_incident_alerts(incident, "verified")
     return {"success": True, "verification_status": "verified"}
 
 
 @router.put("/admin/incidents/{incident_id}/reject")
 async def admin_reject_incident(request: Request, incident_id: int):
     await require_admin(request)
-    result = await db.incidents.update_one(
-        {"id": incident_id}, {"$set": {"verification_status": "rejected"}}
+    change = await next_change()
+    incident = await db.incidents.find_one_and_update(
+        {"id": incident_id},
+        {"$set": {"verification_status": "rejected", **change}},
+        projection={
+            "_id": 0,
+            **{f: 1 for f in ("id", "datetime", "severity", "verification_status", "lat", "lng")},
+        },
     )
-    if result.matched_count == 0:
+    if incident is None:
         raise HTTPException(status_code=404, detail="Incident not found")
-    await ws_manager.broadcast({"type": "incident_removed", "incident_id": incident_id})
+    await invalidate_incident_feed()
+    invalidate_admin_stats()
+    await record_incident_change(incident, incident.get("verification_status"), "rejected")
+    # lat/lng let regional WebSocket subscriptions route the removal.
+    await ws_manager.broadcast(
+        {
+            "type": "incident_removed",
+            "incident_id": incident_id,
+            "change_seq": change["change_seq"],
+            "lat": incident.get("lat"),
+            "lng": incident.get("lng"),
+        }
+    )
     return {"success": True, "verification_status": "rejected"}
 
 
+@router.get("/admin/analytics/incidents")
+async def admin_incident_series(
+    request: Request,
+    interval: str = "day",
+    since: str | None = None,
+    until: str | None = None,
+    group_by: str | None = None,
+    severity: str | None = None,
+    status: str | None = None,
+    region: str | None = None,
+):
+    await require_admin(request)
+    try:
+        series = await incident_series(
+            interval,
+            since=since,
+            until=until,
+            group_by=group_by,
+            severity=severity,
+            status=status,
+            region=region,
+        )
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return {"interval": interval, "group_by": group_by, "series": series}
+
+
+@router.post("/admin/analytics/rebuild")
+async def admin_rebuild_analytics(request: Request):
+    await require_admin(request)
+    await rebuild_rollups()
+    return {"success": True}
+
+
 @router.get("/admin/subscribers")
 async def admin_get_subscribers(request: Request):
     await require_admin(request)
-    return await db.subscribers.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
+    return (
+        await db.subscribers.find({}, {"_id": 0, "location": 0})
+        .sort("created_at", -1)
+        .to_list(100)
+    )
 
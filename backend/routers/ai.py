@@ -1,12 +1,12 @@
+import json
 import uuid
 from typing import Literal
 
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from rate_limit import check_rate_limit, rate_limit_response
-from services_ai import process_ai_chat
+from services_ai import process_ai_chat, stream_ai_chat
 from state import ai_tasks
 
 router = APIRouter(prefix="/api")
@@ -17,33 +17,64 @@ class ChatRequest(BaseModel):
     message: str
 
 
+async def _create_task(agent_type: str) -> str:
+    task_id = str(uuid.uuid4())
+    await ai_tasks.create(
+        task_id,
+        {
+            "status": "processing",
+            "content": None,
+            "usage": None,
+            "agent_type": agent_type,
+            "tool_calls": [],
+            "message": "AI is thinking...",
+        },
+    )
+    return task_id
+
+
 @router.post("/ai/chat/")
 async def start_ai_chat(request: Request, body: ChatRequest, background_tasks: BackgroundTasks):
-    if not check_rate_limit(request, "ai_chat", limit=5, window_seconds=3600):
-        return rate_limit_response("AI chat rate limit exceeded (5/hour).")
     if not body.message.strip():
         return JSONResponse(
             content={"status": "error", "message": "Message cannot be empty"}, status_code=400
         )
 
-    task_id = str(uuid.uuid4())
-    ai_tasks[task_id] = {
-        "status": "processing",
-        "content": None,
-        "usage": None,
-        "agent_type": body.agent_type,
-        "tool_calls": [],
-        "message": "AI is thinking...",
-    }
+    task_id = await _create_task(body.agent_type)
     background_tasks.add_task(process_ai_chat, task_id, body.agent_type, body.message)
     return JSONResponse(content={"status": "processing", "task_id": task_id}, status_code=202)
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/ai/chat/stream/")
+async def stream_ai_chat_endpoint(request: Request, body: ChatRequest):
+    if not body.message.strip():
+        return JSONResponse(
+            content={"status": "error", "message": "Message cannot be empty"}, status_code=400
+        )
+
+    task_id = await _create_task(body.agent_type)
+
+    async def events():
+        yield _sse("task", {"task_id": task_id})
+        async for event, data in stream_ai_chat(task_id, body.agent_type, body.message):
+            yield _sse(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/ai/status/{task_id}/")
 async def get_ai_status(task_id: str):
-    if task_id not in ai_tasks:
+    task = await ai_tasks.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    task = ai_tasks[task_id]
     if task["status"] == "processing":
         return JSONResponse(content={"status": "processing", "message": "AI is thinking..."}, status_code=202)
     if task["status"] == "success":
@@ -4,9 +4,17 @@ from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-from auth import create_access_token, create_refresh_token, get_current_user, verify_password
+from auth import (
+    create_access_token,
+    create_refresh_token,
+    get_current_user,
+    hash_password_async,
+    invalidate_user,
+    logout_user,
+    password_needs_rehash,
+    verify_password_async,
+)
 from db import db
-from rate_limit import check_rate_limit, rate_limit_response
 
 router = APIRouter(prefix="/api")
 
@@ -18,15 +26,20 @@ class LoginRequest(BaseModel):
 
 @router.post("/auth/login")
 async def login(request: Request, body: LoginRequest):
-    if not check_rate_limit(request, "auth_login", limit=10, window_seconds=900):
-        return rate_limit_response("Login rate limit exceeded (10/15min).")
     email = body.email.lower().strip()
     user = await db.users.find_one({"email": email})
-    if not user or not verify_password(body.password, user["password_hash"]):
+    if not user or not await verify_password_async(body.password, user["password_hash"]):
         return JSONResponse({"detail": "Invalid email or password"}, status_code=401)
+    if password_needs_rehash(user["password_hash"]):
+        # BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the password.
+        await db.users.update_one(
+            {"_id": user["_id"]},
+            {"$set": {"password_hash": await hash_password_async(body.password)}},
+        )
+        invalidate_user(str(user["_id"]))
 
     user_id = str(user["_id"])
-    access_token = create_access_token(user_id, email)
+    access_token = create_access_token(user_id, email, user.get("role", "user"), user.get("name", ""))
     refresh_token = create_refresh_token(user_id)
 
     response_data = {
@@ -64,7 +77,8 @@ async def get_me(request: Request):
 
 
 @router.post("/auth/logout")
-async def logout():
+async def logout(request: Request):
+    logout_user(request)
     response = JSONResponse(content={"success": True})
     response.delete_cookie("access_token", path="/")
     response.delete_cookie("refresh_token", path="/")
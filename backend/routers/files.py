@@ -1,66 +1,310 @@
+import asyncio
+import hashlib
 import logging
 import uuid
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, File, HTTPException, Request, UploadFile
-from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pymongo import ReturnDocument
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 
 from db import db
-from rate_limit import check_rate_limit, rate_limit_response
-from storage import APP_NAME, get_object, put_object
+from feed_cache import etag_matches
+from images import VARIANT_CONTENT_TYPE, VARIANTS, generate_variants
+from storage import (
+    APP_NAME,
+    CHUNK_SIZE,
+    get_object,
+    open_object,
+    put_object,
+    put_object_stream,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api")
 
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
 MAX_FILE_SIZE = 10 * 1024 * 1024
+# Room for multipart boundaries and part headers around the file itself.
+MAX_FORM_OVERHEAD = 64 * 1024
+FILE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# A failed variant build may be transient, so its stand-in must not be cached as the variant.
+FALLBACK_CACHE_CONTROL = "no-store"
+
+
+# Variant builds in flight, keyed by blob hash (or file id for files stored before
+# deduplication), so concurrent requests share one build.
+_variant_jobs: dict[str, asyncio.Task] = {}
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+async def _limited_body(request: Request, limit: int):
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise FileTooLarge()
+        yield chunk
+
+
+async def _file_chunks(file: UploadFile):
+    size = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            raise FileTooLarge()
+        yield chunk
+
+
+def _hash_file(fileobj) -> tuple[str, int]:
+    """SHA-256 and size of a spooled upload, read in chunks; runs in a worker thread."""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while chunk := fileobj.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            raise FileTooLarge()
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+async def _store_blob(file: UploadFile, sha256: str, size: int, ext: str) -> tuple[dict, bool]:
+    """Take a reference on the blob holding this content, uploading it if it is new.
+
+    Returns the blob and whether its content was already stored.
+    """
+    blob = await db.blobs.find_one_and_update(
+        {"_id": sha256},
+        {
+            "$inc": {"ref_count": 1},
+            "$setOnInsert": {
+                "size": size,
+                "storage_path": None,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            },
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if blob.get("storage_path"):
+        return blob, True
+    try:
+        # Concurrent first uploads of the same content write the same object; that is harmless.
+        path = f"{APP_NAME}/blobs/{sha256[:2]}/{sha256}.{ext}"
+        result = await put_object_stream(path, _file_chunks(file), file.content_type or "image/jpeg")
+        blob["storage_path"] = result["path"]
+        await db.blobs.update_one({"_id": sha256}, {"$set": {"storage_path": result["path"]}})
+    except BaseException:
+        await db.blobs.update_one({"_id": sha256}, {"$inc": {"ref_count": -1}})
+        raise
+    return blob, False
+
+
+def _too_large_response() -> JSONResponse:
+    return JSONResponse(content={"error": "File too large. Max 10MB"}, status_code=400)
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Parse a single ``bytes=`` range; raises ``ValueError`` if it cannot be satisfied.
+
+    Returns None when the whole file should be sent (no header, or a form we ignore).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError("Empty suffix range")
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError("Malformed range")
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _variant_owner(record: dict) -> tuple:
+    """Where a file's variants live: its blob, or the file record for pre-dedup files."""
+    if record.get("sha256"):
+        return db.blobs, {"_id": record["sha256"]}, record["sha256"]
+    return db.files, {"id": record["id"]}, record["id"]
+
+
+async def _build_variants(record: dict) -> dict:
+    collection, query, key = _variant_owner(record)
+    data, _ = await get_object(record["storage_path"])
+    rendered = await generate_variants(data)
+    variants = {}
+    for name, content in rendered.items():
+        path = f"{APP_NAME}/variants/{key}/{name}.webp"
+        result = await put_object(path, content, VARIANT_CONTENT_TYPE)
+        variants[name] = {
+            "storage_path": result["path"],
+            "size": result.get("size", len(content)),
+            "content_type": VARIANT_CONTENT_TYPE,
+        }
+    await collection.update_one(query, {"$set": {"variants": variants}})
+    return variants
+
+
+def _variant_build_done(key: str, task: asyncio.Task) -> None:
+    _variant_jobs.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Could not generate variants for %s: %s", key, task.exception())
+
+
+def start_variant_build(record: dict) -> asyncio.Task:
+    key = _variant_owner(record)[2]
+    task = _variant_jobs.get(key)
+    if task is None:
+        task = asyncio.create_task(_build_variants(record))
+        _variant_jobs[key] = task
+        task.add_done_callback(lambda done: _variant_build_done(key, done))
+    return task
+
+
+async def ensure_variants(record: dict) -> dict:
+    """Return the file's variants, generating and storing them on first use."""
+    variants = record.get("variants")
+    if not variants and record.get("sha256"):
+        blob = await db.blobs.find_one({"_id": record["sha256"]}, {"variants": 1})
+        variants = (blob or {}).get("variants")
+    if variants:
+        return variants
+    # Shielded so one cancelled request does not abort the build for the others.
+    return await asyncio.shield(start_variant_build(record))
 
 
 @router.post("/upload/")
-async def upload_file(request: Request, file: UploadFile = File(...)):
-    if not check_rate_limit(request, "upload_file", limit=20, window_seconds=3600):
-        return rate_limit_response("Upload rate limit exceeded (20/hour).")
-    if file.content_type not in ALLOWED_IMAGE_TYPES:
-        return JSONResponse(
-            content={"error": "Invalid file type. Allowed: jpg, png, webp, gif"},
-            status_code=400,
-        )
-
-    data = await file.read()
-    if len(data) > MAX_FILE_SIZE:
-        return JSONResponse(content={"error": "File too large. Max 10MB"}, status_code=400)
-
-    ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-    file_id = str(uuid.uuid4())
-    path = f"{APP_NAME}/uploads/{file_id}.{ext}"
+async def upload_file(request: Request):
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_FILE_SIZE + MAX_FORM_OVERHEAD:
+        return _too_large_response()
 
+    # Parse the form from a size-limited body stream so oversized uploads are cut off
+    # early; the parser spools the file to disk rather than holding it in memory.
     try:
-        result = put_object(path, data, file.content_type or "image/jpeg")
+        form = await MultiPartParser(
+            request.headers,
+            _limited_body(request, MAX_FILE_SIZE + MAX_FORM_OVERHEAD),
+            max_files=1,
+            max_fields=10,
+        ).parse()
+    except FileTooLarge:
+        return _too_large_response()
+    except MultiPartException:
+        return JSONResponse(content={"error": "Invalid upload"}, status_code=400)
+
+    file = form.get("file")
+    try:
+        if not isinstance(file, UploadFile):
+            return JSONResponse(content={"error": "'file' is required"}, status_code=400)
+        if file.content_type not in ALLOWED_IMAGE_TYPES:
+            return JSONResponse(
+                content={"error": "Invalid file type. Allowed: jpg, png, webp, gif"},
+                status_code=400,
+            )
+
+        filename = file.filename or ""
+        ext = filename.split(".")[-1] if "." in filename else "jpg"
+        file_id = str(uuid.uuid4())
+
+        sha256, size = await asyncio.to_thread(_hash_file, file.file)
+        blob, duplicate = await _store_blob(file, sha256, size, ext)
         doc = {
             "id": file_id,
-            "storage_path": result["path"],
-            "original_filename": file.filename,
+            "storage_path": blob["storage_path"],
+            "sha256": sha256,
+            "duplicate": duplicate,
+            "original_filename": filename,
             "content_type": file.content_type,
-            "size": result.get("size", len(data)),
+            "size": size,
             "is_deleted": False,
             "created_at": datetime.now(timezone.utc).isoformat(),
         }
         await db.files.insert_one(doc)
-        return {"id": file_id, "path": result["path"], "url": f"/api/files/{file_id}"}
+        if not duplicate:
+            # Variants are built off the request path; serving falls back to a lazy build.
+            start_variant_build(doc)
+        return {
+            "id": file_id,
+            "path": blob["storage_path"],
+            "url": f"/api/files/{file_id}",
+            "sha256": sha256,
+            "duplicate": duplicate,
+        }
+    except FileTooLarge:
+        return _too_large_response()
     except Exception as e:
         logger.error("Upload error: %s", e)
         return JSONResponse(content={"error": "Upload failed. Please try again."}, status_code=500)
+    finally:
+        await form.close()
 
 
 @router.get("/files/{file_id}")
-async def serve_file(file_id: str):
+async def serve_file(request: Request, file_id: str, variant: str | None = None):
+    if variant is not None and variant not in VARIANTS:
+        raise HTTPException(status_code=400, detail=f"variant must be one of: {', '.join(VARIANTS)}")
     record = await db.files.find_one({"id": file_id, "is_deleted": False})
     if not record:
         raise HTTPException(status_code=404, detail="File not found")
+
+    # File ids are never reused for different content, so the id is a strong validator.
+    etag = f'"{record["id"]}"'
+    cache_control = FILE_CACHE_CONTROL
+    if variant is not None:
+        try:
+            record = (await ensure_variants(record))[variant]
+            etag = f'"{file_id}-{variant}"'
+        except Exception as e:
+            # Serve the original rather than failing when the image cannot be processed.
+            logger.warning("Variant %s unavailable for file %s: %s", variant, file_id, e)
+            etag = f'"{file_id}-{variant}-original"'
+            cache_control = FALLBACK_CACHE_CONTROL
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    size = record.get("size")
+    byte_range = None
+    if size is not None and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range or (0, None)
     try:
-        data, content_type = get_object(record["storage_path"])
-        return Response(content=data, media_type=record.get("content_type", content_type))
+        reader = await open_object(record["storage_path"], start, end)
     except Exception as e:
         logger.error("File serve error: %s", e)
         raise HTTPException(status_code=500, detail="Could not retrieve file")
 
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+    elif size is not None:
+        headers["Content-Length"] = str(size)
+    return StreamingResponse(
+        reader.iter_chunks(),
+        status_code=status_code,
+        media_type=record.get("content_type", reader.content_type),
+        headers=headers,
+        # Releases the storage slot even if the client disconnects before the first chunk.
+        background=BackgroundTask(reader.aclose),
+    )
@@ -2,31 +2,171 @@ import uuid
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
+from admin_stats import invalidate_admin_stats
+from alerts import schedule_incident_alerts, subscriber_location
+from analytics import record_incident_change
 from db import db
-from mailer import send_alert_email
-from rate_limit import check_rate_limit, rate_limit_response
+from feed_cache import (
+    etag_matches,
+    incident_feed_cache,
+    invalidate_incident_feed,
+    render_json,
+)
+from flag_log import flag_log
+from outbox import email_outbox
+from pagination import fetch_incident_page, incident_projection, parse_fields
 from realtime import ws_manager
-from services_incidents import get_next_incident_id
+from services_incidents import (
+    FLAG_THRESHOLD,
+    MAX_UNBOUNDED_CLUSTER_ZOOM,
+    build_incident_query,
+    cluster_cell_size,
+    cluster_pipeline,
+    current_change_state,
+    flag_update_pipeline,
+    format_cluster,
+    get_next_incident_id,
+    incident_location,
+    next_change,
+    settled_change_seq,
+)
 
 router = APIRouter(prefix="/api")
 
 
+def _feed_response(request: Request, body: bytes, etag: str, headers: dict) -> Response:
+    headers = {**headers, "ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/incidents/")
-async def get_incidents():
-    incidents = (
-        await db.incidents.find({"verification_status": {"$ne": "rejected"}}, {"_id": 0})
-        .sort("datetime", -1)
-        .to_list(500)
+async def get_incidents(
+    request: Request,
+    bbox: str | None = None,
+    lat: float | None = None,
+    lng: float | None = None,
+    radius_km: float | None = None,
+    severity: str | None = None,
+    status: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    limit: int = 500,
+    cursor: str | None = None,
+    fields: str | None = None,
+):
+    cache_key = "&".join(sorted(request.url.query.split("&")))
+    version = await incident_feed_cache.version()
+    cached = incident_feed_cache.get(cache_key, version)
+    if cached is not None:
+        return _feed_response(request, *cached)
+
+    # Read before the query: changes landing while it runs are replayed by the next delta sync.
+    _, floor = await current_change_state()
+    change_seq = await settled_change_seq(floor)
+    try:
+        projection_fields = parse_fields(fields)
+        query = build_incident_query(
+            bbox=bbox,
+            lat=lat,
+            lng=lng,
+            radius_km=radius_km,
+            severity=severity,
+            status=status,
+            since=since,
+            until=until,
+        )
+        limit = max(1, min(limit, 500))
+        incidents, next_cursor = await fetch_incident_page(
+            db.incidents, query, limit, cursor=cursor, fields=projection_fields
+        )
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    # The body stays a bare list for existing clients; the next page is advertised in a header.
+    headers = {"X-Change-Seq": str(change_seq)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    body = render_json(incidents)
+    etag = incident_feed_cache.put(cache_key, version, body, headers)
+    return _feed_response(request, body, etag, headers)
+
+
+@router.get("/incidents/changes")
+async def get_incident_changes(since: int = 0, limit: int = 1000, fields: str | None = None):
+    seq, floor = await current_change_state()
+    if since < floor or since > seq:
+        # The client's baseline predates a reseed (or another database): refetch the feed.
+        return {"reset": True, "seq": seq}
+    settled = await settled_change_seq(floor)
+    try:
+        projection_fields = parse_fields(fields)
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    limit = max(1, min(limit, 1000))
+    projection = incident_projection(projection_fields)
+    projection.update({"verification_status": 1, "change_seq": 1} if projection_fields else {})
+    docs = (
+        await db.incidents.find({"change_seq": {"$gt": since}}, projection)
+        .sort("change_seq", 1)
+        .limit(limit)
+        .to_list(limit)
     )
-    return JSONResponse(content=incidents)
+    changed, removed = [], []
+    for doc in docs:
+        if doc.get("verification_status") == "rejected":
+            removed.append(doc["id"])
+        elif projection_fields is None:
+            changed.append(doc)
+        else:
+            changed.append({k: v for k, v in doc.items() if k in projection_fields})
+    # The cursor never passes a change that could still be in flight; unsettled
+    # changes are sent now and again on the next poll.
+    last_read = docs[-1]["change_seq"] if docs else since
+    next_seq = max(since, min(last_read, settled))
+    return {
+        "reset": False,
+        "seq": next_seq,
+        "has_more": len(docs) == limit and next_seq == last_read,
+        "changed": changed,
+        "removed": removed,
+    }
+
+
+@router.get("/incidents/clusters")
+async def get_incident_clusters(
+    zoom: int,
+    bbox: str | None = None,
+    severity: str | None = None,
+    status: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+):
+    if bbox is None and zoom > MAX_UNBOUNDED_CLUSTER_ZOOM:
+        return JSONResponse(
+            content={
+                "status": "error",
+                "message": f"bbox is required above zoom {MAX_UNBOUNDED_CLUSTER_ZOOM}",
+            },
+            status_code=422,
+        )
+    try:
+        query = build_incident_query(
+            bbox=bbox, severity=severity, status=status, since=since, until=until
+        )
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    cell_size = cluster_cell_size(zoom)
+    groups = await db.incidents.aggregate(cluster_pipeline(query, cell_size)).to_list(None)
+    clusters = [format_cluster(g, cell_size) for g in groups]
+    clusters.sort(key=lambda c: -c["count"])
+    return JSONResponse(content={"zoom": zoom, "cell_size": cell_size, "clusters": clusters})
 
 
 @router.post("/incidents/{incident_id}/flag/")
 async def flag_incident(incident_id: int, request: Request):
-    if not check_rate_limit(request, "flag_incident", limit=10, window_seconds=3600):
-        return rate_limit_response("Flag rate limit exceeded (10/hour).")
     try:
         data = await request.json()
     except Exception:
@@ -41,32 +181,43 @@ async def flag_incident(incident_id: int, request: Request):
             status_code=400,
         )
 
-    incident = await db.incidents.find_one({"id": incident_id})
+    # One atomic update counts the flag and applies the threshold, so concurrent
+    # flags can neither lose a count nor both miss the status change.
+    incident = await db.incidents.find_one_and_update(
+        {"id": incident_id},
+        flag_update_pipeline(),
+        projection={
+            "_id": 0,
+            **{f: 1 for f in ("id", "datetime", "severity", "lat", "lng", "verification_status", "flag_count")},
+        },
+    )
     if not incident:
         return JSONResponse(content={"error": "Incident not found"}, status_code=404)
 
-    await db.flags.insert_one(
+    flag_log.append(
         {
             "incident_id": incident_id,
             "reason": reason,
             "created_at": datetime.now(timezone.utc).isoformat(),
         }
     )
-    flag_count = await db.flags.count_documents({"incident_id": incident_id})
+    # The update returned the document as it was before, so the outcome is derived here.
+    flag_count = incident.get("flag_count", 0) + 1
     new_status = incident.get("verification_status", "unverified")
-    if flag_count >= 3 and new_status == "unverified":
+    if flag_count >= FLAG_THRESHOLD and new_status == "unverified":
         new_status = "flagged"
-        await db.incidents.update_one(
-            {"id": incident_id}, {"$set": {"verification_status": new_status}}
-        )
+        # Only the flip needs a change_seq; the settle window in settled_change_seq
+        # covers the moment between the two writes.
+        await db.incidents.update_one({"id": incident_id}, {"$set": await next_change()})
+        await invalidate_incident_feed()
+        invalidate_admin_stats()
+        await record_incident_change(incident, "unverified", new_status)
 
     return {"success": True, "flag_count": flag_count, "verification_status": new_status}
 
 
 @router.post("/report/")
 async def report_incident(request: Request):
-    if not check_rate_limit(request, "report_incident", limit=5, window_seconds=3600):
-        return rate_limit_response("Report rate limit exceeded (5/hour).")
     try:
         data = await request.json()
         lat = data.get("lat", data.get("latitude"))
@@ -102,17 +253,24 @@ async def report_incident(request: Request):
             "datetime": incident_dt,
             "lat": lat,
             "lng": lng,
+            "location": incident_location(lat, lng),
             "description": data.get("description", ""),
             "severity": severity,
             "source": data.get("source", ""),
             "image": data.get("image", ""),
             "image_file_id": data.get("image_file_id", ""),
             "verification_status": "unverified",
+            "flag_count": 0,
             "created_at": datetime.now(timezone.utc).isoformat(),
+            **await next_change(),
         }
         await db.incidents.insert_one(doc)
-        broadcast_doc = {k: v for k, v in doc.items() if k != "_id"}
+        await invalidate_incident_feed()
+        invalidate_admin_stats()
+        await record_incident_change(doc, None, "unverified")
+        broadcast_doc = {k: v for k, v in doc.items() if k not in ("_id", "location", "changed_at")}
         await ws_manager.broadcast({"type": "new_incident", "incident": broadcast_doc})
+        schedule_incident_alerts(broadcast_doc, "created")
         return JSONResponse(content={"status": "success", "id": incident_id}, status_code=201)
     except Exception:
         return JSONResponse(
@@ -123,8 +281,6 @@ async def report_incident(request: Request):
 
 @router.post("/subscribe/")
 async def subscribe(request: Request):
-    if not check_rate_limit(request, "subscribe", limit=5, window_seconds=3600):
-        return rate_limit_response("Subscription rate limit exceeded (5/hour).")
     try:
         data = await request.json()
         name, email = data.get("name"), data.get("email")
@@ -159,29 +315,30 @@ async def subscribe(request: Request):
             "created_at": datetime.now(timezone.utc).isoformat(),
             "active": True,
         }
+        location = subscriber_location(doc["latitude"], doc["longitude"])
+        if location:
+            doc["location"] = location
         await db.subscribers.insert_one(doc)
         address_label = data.get("address", "").strip() or "Not provided"
-        email_sent, email_status = send_alert_email(
-            to_email=email,
-            to_name=name,
-            subject="SafeGuard Alert Subscription Confirmed",
-            body=(
-                f"Hello {name},\n\n"
-                "Your SafeGuard alert subscription has been confirmed.\n\n"
-                f"Address: {address_label}\n"
-                f"Radius: {radius_km} km\n\n"
-                "You will receive alerts for incidents within your configured area.\n\n"
-                "Stay safe,\n"
-                "SafeGuard Team"
-            ),
+        # Delivered by the outbox worker so the response never waits on the mail provider.
+        await email_outbox.enqueue(
+            {
+                "dedup_key": f"subscribed:{doc['id']}",
+                "to_email": email,
+                "to_name": name,
+                "subject": "SafeGuard Alert Subscription Confirmed",
+                "body": (
+                    f"Hello {name},\n\n"
+                    "Your SafeGuard alert subscription has been confirmed.\n\n"
+                    f"Address: {address_label}\n"
+                    f"Radius: {radius_km} km\n\n"
+                    "You will receive alerts for incidents within your configured area.\n\n"
+                    "Stay safe,\n"
+                    "SafeGuard Team"
+                ),
+            }
         )
-        response_payload = {
-            "status": "success",
-            "email_sent": email_sent,
-        }
-        if not email_sent:
-            response_payload["email_warning"] = email_status
-        return JSONResponse(content=response_payload, status_code=201)
+        return JSONResponse(content={"status": "success", "email_queued": True}, status_code=201)
     except Exception:
         return JSONResponse(
             content={"status": "error", "message": "Could not create subscription"},
@@ -194,7 +351,7 @@ async def get_subscribers(email: str | None = None):
     query = {"active": True}
     if email:
         query["email"] = email
-    subs = await db.subscribers.find(query, {"_id": 0}).to_list(100)
+    subs = await db.subscribers.find(query, {"_id": 0, "location": 0}).to_list(100)
     return JSONResponse(content=subs)
 
 
@@ -1,8 +1,10 @@
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 
 from db import db
-from knowledge import EMERGENCY_PROCEDURES_CONTENT, FIRST_AID_CONTENT
+from knowledge import emergency_procedures_content, first_aid_content
 
 router = APIRouter(prefix="/api")
 
@@ -10,9 +12,9 @@ router = APIRouter(prefix="/api")
 @router.get("/offline/packs/{pack_name}")
 async def get_offline_pack(pack_name: str):
     if pack_name == "first_aid":
-        content = FIRST_AID_CONTENT
+        content = await asyncio.to_thread(first_aid_content)
     elif pack_name == "emergency_procedures":
-        content = EMERGENCY_PROCEDURES_CONTENT
+        content = await asyncio.to_thread(emergency_procedures_content)
     elif pack_name == "resource_directory":
         resources = await db.resources.find({}, {"_id": 0}).to_list(200)
         content = "# Resource Directory\n\n"
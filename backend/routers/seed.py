@@ -6,10 +6,13 @@ from pathlib import Path
 
 from fastapi import APIRouter, Request
 
+from analytics import rebuild_rollups
 from auth import require_admin
 from config import ALLOW_DESTRUCTIVE_SEED, ALLOW_PUBLIC_SEED
 from db import db
-from rate_limit import check_rate_limit, rate_limit_response
+from feed_cache import invalidate_incident_feed
+from flag_log import flag_log
+from services_incidents import incident_location, reset_change_floor
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api")
@@ -33,8 +36,6 @@ def parse_django_point(point_str):
 
 @router.post("/seed/")
 async def seed_data(request: Request):
-    if not check_rate_limit(request, "seed_data", limit=3, window_seconds=3600):
-        return rate_limit_response("Seed rate limit exceeded (3/hour).")
     if seed_requires_admin(ALLOW_PUBLIC_SEED):
         await require_admin(request)
     if not seed_allows_destructive_reset(ALLOW_DESTRUCTIVE_SEED):
@@ -97,9 +98,11 @@ async def seed_data(request: Request):
                 "datetime": inc["dt"],
                 "lat": inc["lat"],
                 "lng": inc["lng"],
+                "location": incident_location(inc["lat"], inc["lng"]),
                 "description": inc["desc"],
                 "severity": inc["sev"],
                 "verification_status": inc["vs"],
+                "flag_count": 0,
                 "source": inc["src"],
                 "image": "",
                 "image_file_id": "",
@@ -149,6 +152,10 @@ async def seed_data(request: Request):
 
     await db.incidents.delete_many({})
     await db.resources.delete_many({})
+    change_floor = await reset_change_floor()
+    for incident in incidents:
+        incident["change_seq"] = change_floor
+    flag_log.clear()
     await db.flags.delete_many({})
     await db.counters.update_one(
         {"_id": "incident_id"}, {"$set": {"seq": len(incidents)}}, upsert=True
@@ -157,5 +164,7 @@ async def seed_data(request: Request):
         await db.incidents.insert_many(incidents)
     if resources:
         await db.resources.insert_many(resources)
+    await invalidate_incident_feed()
+    await rebuild_rollups()
     return {"success": True, "seeded": {"incidents": len(incidents), "resources": len(resources)}}
 
@@ -5,6 +5,7 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from config import parse_cors_origins
+from rate_limit import RateLimitMiddleware
 from realtime import register_websocket
 from routers.admin import router as admin_router
 from routers.ai import router as ai_router
@@ -42,11 +43,14 @@ for r in [
 ]:
     app.include_router(r)
 
+# Added before CORS so that 429 responses still carry CORS headers.
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=allow_credentials,
     allow_origins=cors_origins,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Change-Seq", "X-Next-Cursor", "Accept-Ranges", "Content-Range"],
 )
 
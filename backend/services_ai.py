@@ -1,96 +1,416 @@
+import asyncio
 import logging
 import os
-import asyncio
+import random
+from abc import ABC, abstractmethod
+
+import anyio
+import httpx
+from ollama import AsyncClient
+from ollamafreeapi import OllamaFreeAPI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
-from knowledge import AGENT_SYSTEM_MESSAGES
+from knowledge import (
+    AGENT_KNOWLEDGE_SCOPES,
+    build_system_prompt,
+    on_knowledge_change,
+    refresh_knowledge,
+)
+from knowledge_index import estimate_tokens
+from response_cache import create_response_cache
 from state import ai_tasks
 
 logger = logging.getLogger(__name__)
 
+MEDICAL_DISCLAIMER = (
+    "⚠️ This is general first-aid guidance only. "
+    "Seek professional medical help immediately for serious conditions."
+)
+
+
+def _ollama_prompt(agent_type: str, message: str) -> str:
+    return f"{build_system_prompt(agent_type, message)}\n\nUser request:\n{message}"
+
+
+def _openai_messages(agent_type: str, message: str) -> list[dict]:
+    return [
+        {"role": "system", "content": build_system_prompt(agent_type, message)},
+        {"role": "user", "content": message},
+    ]
+
+
+async def _chunks_with_timeout(chunks, timeout_seconds: float):
+    """Relay an upstream stream, bounding each wait for the next chunk.
+
+    The timeout covers only the upstream ``await``, never the time the consumer
+    takes between chunks, and no context manager is held across ``yield``.
+    """
+    iterator = chunks.__aiter__()
+    try:
+        while True:
+            try:
+                async with asyncio.timeout(timeout_seconds):
+                    chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, "aclose", None) or getattr(chunks, "close", None)
+        if close is not None:
+            await close()
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, str(default)))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+class LLMProvider(ABC):
+    """Long-lived async client for one provider, with bounded concurrency."""
+
+    name = ""
+
+    def __init__(self):
+        prefix = f"AI_{self.name.upper()}"
+        self.max_concurrency = _env_int(f"{prefix}_MAX_CONCURRENCY", 16)
+        self.max_connections = _env_int(f"{prefix}_MAX_CONNECTIONS", self.max_concurrency)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @abstractmethod
+    async def complete(self, agent_type: str, message: str) -> str: ...
+
+    @abstractmethod
+    def stream(self, agent_type: str, message: str):
+        """Async iterator of response text chunks."""
+
+    async def aclose(self) -> None:
+        pass
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self):
+        super().__init__()
+        self.model = os.environ.get("OPENAI_MODEL", "gpt-4o")
+        self.timeout_seconds = _env_float("OPENAI_TIMEOUT_SECONDS", 60)
+        self.client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY", ""),
+            timeout=self.timeout_seconds,
+            max_retries=1,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            ),
+        )
+
+    async def complete(self, agent_type: str, message: str) -> str:
+        async with self._semaphore:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=_openai_messages(agent_type, message),
+                max_tokens=1024,
+                temperature=0.3,
+            )
+        return response.choices[0].message.content
+
+    async def stream(self, agent_type: str, message: str):
+        # The slot bounds concurrent request starts; pooled connections bound open streams.
+        async with self._semaphore:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=_openai_messages(agent_type, message),
+                max_tokens=1024,
+                temperature=0.3,
+                stream=True,
+            )
+        async for chunk in _chunks_with_timeout(stream, self.timeout_seconds):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+
+class OllamaFreeAPIProvider(LLMProvider):
+    name = "ollamafreeapi"
+
+    def __init__(self):
+        super().__init__()
+        self.model = os.environ.get("OLLAMAFREE_MODEL", "llama3.2:3b")
+        self.temperature = _env_float("OLLAMAFREE_TEMPERATURE", 0.3)
+        self.timeout_seconds = _env_float("OLLAMAFREE_TIMEOUT_SECONDS", 45)
+        # OllamaFreeAPI only supplies the model/server catalog; requests go through
+        # one pooled AsyncClient per server host.
+        self.catalog = OllamaFreeAPI()
+        self._clients: dict[str, AsyncClient] = {}
+
+    def _client_for(self, host: str):
+        client = self._clients.get(host)
+        if client is None:
+            client = AsyncClient(
+                host=host,
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._clients[host] = client
+        return client
+
+    def _servers(self) -> list[dict]:
+        servers = self.catalog.get_model_servers(self.model)
+        if not servers:
+            raise RuntimeError(f"No servers available for model '{self.model}'")
+        random.shuffle(servers)
+        return servers
+
+    def _request(self, agent_type: str, message: str) -> dict:
+        return self.catalog.generate_api_request(
+            self.model, _ollama_prompt(agent_type, message), temperature=self.temperature
+        )
+
+    async def complete(self, agent_type: str, message: str) -> str:
+        request = self._request(agent_type, message)
+        last_error = None
+        async with self._semaphore, asyncio.timeout(self.timeout_seconds):
+            for server in self._servers():
+                try:
+                    response = await self._client_for(server["url"]).generate(**request)
+                    return response["response"]
+                except Exception as e:
+                    last_error = e
+        raise RuntimeError(f"All servers failed for model '{self.model}'. Last error: {last_error}")
+
+    async def stream(self, agent_type: str, message: str):
+        request = self._request(agent_type, message)
+        last_error = None
+        for server in self._servers():
+            started = False
+            try:
+                async with self._semaphore, asyncio.timeout(self.timeout_seconds):
+                    chunks = await self._client_for(server["url"]).generate(**request, stream=True)
+                async for chunk in _chunks_with_timeout(chunks, self.timeout_seconds):
+                    started = True
+                    if chunk["response"]:
+                        yield chunk["response"]
+                return
+            except Exception as e:
+                # Once tokens have been forwarded, retrying elsewhere would duplicate them.
+                if started:
+                    raise
+                last_error = e
+        raise RuntimeError(f"All servers failed for model '{self.model}'. Last error: {last_error}")
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+
+PROVIDER_CLASSES = {
+    OpenAIProvider.name: OpenAIProvider,
+    OllamaFreeAPIProvider.name: OllamaFreeAPIProvider,
+}
+_providers: dict[str, LLMProvider] = {}
+
+
+def get_provider(name: str) -> LLMProvider:
+    provider = _providers.get(name)
+    if provider is None:
+        provider = PROVIDER_CLASSES[name]()
+        _providers[name] = provider
+    return provider
+
+
+async def close_providers() -> None:
+    for provider in list(_providers.values()):
+        try:
+            await provider.aclose()
+        except Exception as e:
+            logger.error("Failed to close AI provider %s: %s", provider.name, e)
+    _providers.clear()
+
 
 async def _run_ollamafreeapi(agent_type: str, message: str):
-    from ollamafreeapi import OllamaFreeAPI
-
-    model = os.environ.get("OLLAMAFREE_MODEL", "llama3.2:3b")
-    temperature = float(os.environ.get("OLLAMAFREE_TEMPERATURE", "0.3"))
-    client = OllamaFreeAPI()
-    prompt = (
-        f"{AGENT_SYSTEM_MESSAGES.get(agent_type, AGENT_SYSTEM_MESSAGES['general'])}\n\n"
-        f"User request:\n{message}"
-    )
-    timeout_seconds = float(os.environ.get("OLLAMAFREE_TIMEOUT_SECONDS", "45"))
-    return await asyncio.wait_for(
-        asyncio.to_thread(
-            client.chat,
-            model=model,
-            prompt=prompt,
-            temperature=temperature,
-        ),
-        timeout=timeout_seconds,
-    )
+    return await get_provider("ollamafreeapi").complete(agent_type, message)
+
+
+def _stream_ollamafreeapi(agent_type: str, message: str):
+    return get_provider("ollamafreeapi").stream(agent_type, message)
 
 
 async def _run_openai(agent_type: str, message: str):
-    from openai import OpenAI
-
-    api_key = os.environ.get("OPENAI_API_KEY", "")
-    model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-    client = OpenAI(api_key=api_key)
-    system_prompt = AGENT_SYSTEM_MESSAGES.get(agent_type, AGENT_SYSTEM_MESSAGES["general"])
-
-    response = await asyncio.to_thread(
-        client.chat.completions.create,
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message},
-        ],
-        max_tokens=1024,
-        temperature=0.3,
+    return await get_provider("openai").complete(agent_type, message)
+
+
+def _stream_openai(agent_type: str, message: str):
+    return get_provider("openai").stream(agent_type, message)
+
+
+def _resolve_provider() -> str:
+    provider = os.environ.get("AI_PROVIDER", "openai").strip().lower()
+    if provider in {"openai", "gpt"}:
+        return "openai"
+    if provider in {"ollamafreeapi", "ollama_free_api", "ollama"}:
+        return "ollamafreeapi"
+    raise Exception(f"Unsupported AI_PROVIDER '{provider}'. Supported: openai, ollamafreeapi")
+
+
+def _tool_calls_for(agent_type: str) -> list[str]:
+    if agent_type == "recommendation":
+        return ["find_nearby_resources"]
+    if agent_type == "situational":
+        return ["search_web", "get_incident_stats"]
+    if agent_type == "map_intelligence":
+        return ["get_incident_stats"]
+    if agent_type == "medical":
+        return ["find_nearby_resources"]
+    return []
+
+
+def _disclaimer_suffix(agent_type: str, response_text: str) -> str:
+    if agent_type != "medical":
+        return ""
+    if "⚠️" in response_text or "professional medical help" in response_text.lower():
+        return ""
+    return f"\n\n---\n{MEDICAL_DISCLAIMER}"
+
+
+response_cache = create_response_cache()
+if response_cache is not None:
+    for _agent in AGENT_KNOWLEDGE_SCOPES:
+        on_knowledge_change(_agent, lambda agent=_agent: response_cache.invalidate(agent))
+
+
+def _cached_response(agent_type: str, message: str) -> str | None:
+    if response_cache is None:
+        return None
+    # Picks up edited knowledge files so stale answers are dropped before lookup.
+    refresh_knowledge(agent_type)
+    return response_cache.get(agent_type, message)
+
+
+def _cache_response(agent_type: str, message: str, content: str) -> None:
+    if response_cache is not None:
+        response_cache.put(agent_type, message, content)
+
+
+async def _record_success(
+    task_id: str, agent_type: str, content: str, tool_calls: list[str], cached: bool = False
+):
+    if cached:
+        usage = {"input": 0, "cache_read": estimate_tokens(content), "output": 0}
+    else:
+        usage = {"input": 512, "cache_read": 0, "output": 256}
+    await ai_tasks.update(
+        task_id,
+        {
+            "status": "success",
+            "content": content,
+            "usage": usage,
+            "agent_type": agent_type,
+            "tool_calls": tool_calls,
+        },
+    )
+
+
+async def _record_error(task_id: str, error: Exception):
+    await ai_tasks.update(
+        task_id,
+        {
+            "status": "error",
+            "error": str(error),
+            "message": "AI request failed. Please try again.",
+        },
     )
-    return response.choices[0].message.content
 
 
 async def process_ai_chat(task_id: str, agent_type: str, message: str):
     try:
-        ai_tasks[task_id]["status"] = "processing"
-        tool_calls = []
-        if agent_type == "recommendation":
-            tool_calls = ["find_nearby_resources"]
-        elif agent_type == "situational":
-            tool_calls = ["search_web", "get_incident_stats"]
-        elif agent_type == "map_intelligence":
-            tool_calls = ["get_incident_stats"]
-        elif agent_type == "medical":
-            tool_calls = ["find_nearby_resources"]
-        ai_tasks[task_id]["tool_calls"] = tool_calls
-
-        provider = os.environ.get("AI_PROVIDER", "openai").strip().lower()
-        if provider in {"openai", "gpt"}:
+        await ai_tasks.update(task_id, {"status": "processing"})
+        tool_calls = _tool_calls_for(agent_type)
+        await ai_tasks.update(task_id, {"tool_calls": tool_calls})
+
+        cached = _cached_response(agent_type, message)
+        if cached is not None:
+            await _record_success(task_id, agent_type, cached, tool_calls, cached=True)
+            return
+
+        provider = _resolve_provider()
+        if provider == "openai":
             response = await _run_openai(agent_type, message)
-        elif provider in {"ollamafreeapi", "ollama_free_api", "ollama"}:
-            response = await _run_ollamafreeapi(agent_type, message)
         else:
-            raise Exception(
-                f"Unsupported AI_PROVIDER '{provider}'. Supported: openai, ollamafreeapi"
-            )
+            response = await _run_ollamafreeapi(agent_type, message)
         response_text = response if isinstance(response, str) else str(response)
-        if agent_type == "medical":
-            disclaimer = (
-                "⚠️ This is general first-aid guidance only. "
-                "Seek professional medical help immediately for serious conditions."
-            )
-            if "⚠️" not in response_text and "professional medical help" not in response_text.lower():
-                response_text = f"{response_text}\n\n---\n{disclaimer}"
-
-        ai_tasks[task_id]["status"] = "success"
-        ai_tasks[task_id]["content"] = response_text
-        ai_tasks[task_id]["usage"] = {"input": 512, "cache_read": 0, "output": 256}
-        ai_tasks[task_id]["agent_type"] = agent_type
-        ai_tasks[task_id]["tool_calls"] = tool_calls
+        response_text += _disclaimer_suffix(agent_type, response_text)
+        _cache_response(agent_type, message, response_text)
+        await _record_success(task_id, agent_type, response_text, tool_calls)
     except Exception as e:
         logger.error("AI Chat error: %s", e)
-        ai_tasks[task_id]["status"] = "error"
-        ai_tasks[task_id]["error"] = str(e)
-        ai_tasks[task_id]["message"] = "AI request failed. Please try again."
+        await _record_error(task_id, e)
+
+
+async def stream_ai_chat(task_id: str, agent_type: str, message: str):
+    """Yield ``(event, data)`` pairs as the provider produces tokens.
 
+    The task record is finalised exactly as ``process_ai_chat`` would, so
+    clients polling ``/api/ai/status/{task_id}/`` see the same result.
+    """
+    parts: list[str] = []
+    finished = False
+    try:
+        tool_calls = _tool_calls_for(agent_type)
+        await ai_tasks.update(task_id, {"status": "processing", "tool_calls": tool_calls})
+
+        cached = _cached_response(agent_type, message)
+        if cached is not None:
+            yield "token", {"delta": cached}
+            await _record_success(task_id, agent_type, cached, tool_calls, cached=True)
+            finished = True
+            yield "done", {
+                "status": "success",
+                "content": cached,
+                "agent_type": agent_type,
+                "tool_calls": tool_calls,
+                "cached": True,
+            }
+            return
+
+        provider = _resolve_provider()
+        stream = _stream_openai if provider == "openai" else _stream_ollamafreeapi
+        async for delta in stream(agent_type, message):
+            parts.append(delta)
+            yield "token", {"delta": delta}
+
+        response_text = "".join(parts)
+        suffix = _disclaimer_suffix(agent_type, response_text)
+        if suffix:
+            yield "token", {"delta": suffix}
+            response_text += suffix
+        _cache_response(agent_type, message, response_text)
+        await _record_success(task_id, agent_type, response_text, tool_calls)
+        finished = True
+        yield "done", {
+            "status": "success",
+            "content": response_text,
+            "agent_type": agent_type,
+            "tool_calls": tool_calls,
+        }
+    except Exception as e:
+        logger.error("AI Chat stream error: %s", e)
+        await _record_error(task_id, e)
+        finished = True
+        yield "error", {"status": "error", "message": "AI request failed. Please try again."}
+    finally:
+        if not finished:
+            # A client disconnect cancels the response's scope; shield the write so
+            # the task does not stay "processing" until its TTL.
+            with anyio.CancelScope(shield=True):
+                await _record_error(task_id, Exception("Stream closed before completion"))
@@ -1,4 +1,17 @@
+import os
+import time
+from datetime import datetime
+
 from db import db
+from geo_index import EARTH_RADIUS_KM
+
+SEVERITIES = ("critical", "high", "medium", "low")
+PUBLIC_STATUSES = ("unverified", "verified", "flagged")
+INCIDENT_STATUSES = (*PUBLIC_STATUSES, "rejected")
+# Unverified incidents with this many flags are marked "flagged".
+FLAG_THRESHOLD = 3
+# How long an allocated change_seq may take to become visible on its incident.
+CHANGE_SETTLE_SECONDS = float(os.environ.get("CHANGE_SETTLE_SECONDS", "5"))
 
 
 async def get_next_incident_id():
@@ -7,3 +20,277 @@ async def get_next_incident_id():
     )
     return counter["seq"]
 
+
+async def next_change_seq() -> int:
+    """Allocate the next value of the incident change sequence used by delta sync."""
+    counter = await db.counters.find_one_and_update(
+        {"_id": "incident_change"}, {"$inc": {"seq": 1}}, upsert=True, return_document=True
+    )
+    return counter["seq"]
+
+
+async def next_change() -> dict:
+    """Fields to ``$set`` on a changed incident: its new ``change_seq`` and when it was taken."""
+    changed_at = time.time()
+    return {"change_seq": await next_change_seq(), "changed_at": changed_at}
+
+
+async def settled_change_seq(floor: int = 0) -> int:
+    """Highest ``change_seq`` at or below which every change is already visible.
+
+    Sequence numbers are allocated before the incident write commits, so a
+    later number can become visible before an earlier one. A change taken more
+    than ``CHANGE_SETTLE_SECONDS`` ago is assumed to have landed, and with it
+    every change allocated before it.
+    """
+    cutoff = time.time() - CHANGE_SETTLE_SECONDS
+    doc = await db.incidents.find_one(
+        {"change_seq": {"$gt": floor}, "changed_at": {"$not": {"$gt": cutoff}}},
+        {"_id": 0, "change_seq": 1},
+        sort=[("change_seq", -1)],
+    )
+    return doc["change_seq"] if doc else floor
+
+
+async def current_change_state() -> tuple[int, int]:
+    """Return ``(seq, floor)``; changes at or below ``floor`` were wiped by a reseed."""
+    counter = await db.counters.find_one({"_id": "incident_change"})
+    if not counter:
+        return 0, 0
+    return counter.get("seq", 0), counter.get("floor", 0)
+
+
+async def reset_change_floor() -> int:
+    seq = await next_change_seq()
+    await db.counters.update_one({"_id": "incident_change"}, {"$set": {"floor": seq}})
+    return seq
+
+
+def incident_location(lat: float, lng: float) -> dict:
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+async def backfill_incident_locations() -> None:
+    """Give incidents stored before the 2dsphere index a GeoJSON ``location``."""
+    await db.incidents.update_many(
+        {"location": {"$exists": False}, "lat": {"$type": "number"}, "lng": {"$type": "number"}},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$lng", "$lat"]}}}],
+    )
+
+
+async def backfill_flag_counts() -> None:
+    """Give incidents stored before ``flag_count`` existed their count from the flag log."""
+    if await db.incidents.find_one({"flag_count": {"$exists": False}}, {"_id": 1}) is None:
+        return
+    await db.flags.aggregate(
+        [
+            {"$group": {"_id": "$incident_id", "flag_count": {"$sum": 1}}},
+            {"$project": {"_id": 0, "id": "$_id", "flag_count": 1}},
+            {
+                "$merge": {
+                    "into": "incidents",
+                    "on": "id",
+                    "whenMatched": [{"$set": {"flag_count": {"$ifNull": ["$flag_count", "$$new.flag_count"]}}}],
+                    "whenNotMatched": "discard",
+                }
+            },
+        ]
+    ).to_list(None)
+    await db.incidents.update_many({"flag_count": {"$exists": False}}, {"$set": {"flag_count": 0}})
+
+
+def flag_update_pipeline() -> list[dict]:
+    """Count one flag and flag the incident at ``FLAG_THRESHOLD``, as a single atomic update."""
+    flips = {
+        "$and": [
+            {"$gte": ["$flag_count", FLAG_THRESHOLD]},
+            {"$eq": ["$verification_status", "unverified"]},
+        ]
+    }
+    return [
+        {"$set": {"flag_count": {"$add": [{"$ifNull": ["$flag_count", 0]}, 1]}}},
+        {"$set": {"verification_status": {"$cond": [flips, "flagged", "$verification_status"]}}},
+    ]
+
+
+def _bbox_polygon(min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> dict:
+    return {
+        "$geoWithin": {
+            "$geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    [
+                        [min_lng, min_lat],
+                        [max_lng, min_lat],
+                        [max_lng, max_lat],
+                        [min_lng, max_lat],
+                        [min_lng, min_lat],
+                    ]
+                ],
+            }
+        }
+    }
+
+
+def parse_bbox(raw: str) -> tuple[float, float, float, float]:
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in raw.split(","))
+    except ValueError:
+        raise ValueError("bbox must be 'minLng,minLat,maxLng,maxLat'")
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError("Invalid bbox latitude range")
+    if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise ValueError("Invalid bbox longitude range")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def bbox_filter(min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> dict:
+    # Spherical polygon edges bow away from parallels, so the lat range keeps the
+    # result exact to the viewport while the polygon lets the 2dsphere index prune.
+    lat_range = {"lat": {"$gte": min_lat, "$lte": max_lat}}
+    if min_lng > max_lng:
+        # Viewport crosses the antimeridian: split into two boxes.
+        return {
+            **lat_range,
+            "$or": [
+                {"location": _bbox_polygon(min_lng, min_lat, 180.0, max_lat)},
+                {"location": _bbox_polygon(-180.0, min_lat, max_lng, max_lat)},
+            ],
+        }
+    if max_lng - min_lng >= 180:
+        # Polygons wider than a hemisphere are ambiguous on a sphere; plain ranges are exact.
+        return {**lat_range, "lng": {"$gte": min_lng, "$lte": max_lng}}
+    return {**lat_range, "location": _bbox_polygon(min_lng, min_lat, max_lng, max_lat)}
+
+
+def radius_filter(lat: float, lng: float, radius_km: float) -> dict:
+    return {
+        "location": {
+            "$geoWithin": {"$centerSphere": [[lng, lat], radius_km / EARTH_RADIUS_KM]}
+        }
+    }
+
+
+def _parse_choices(raw: str, allowed: tuple[str, ...], name: str) -> list[str]:
+    values = [v.strip().lower() for v in raw.split(",") if v.strip()]
+    invalid = [v for v in values if v not in allowed]
+    if invalid or not values:
+        raise ValueError(f"Invalid {name}. Must be one of: {', '.join(allowed)}")
+    return values
+
+
+def _parse_iso(raw: str, name: str) -> str:
+    try:
+        return datetime.fromisoformat(raw.replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid {name} datetime")
+
+
+def build_incident_query(
+    bbox: str | None = None,
+    lat: float | None = None,
+    lng: float | None = None,
+    radius_km: float | None = None,
+    severity: str | None = None,
+    status: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+) -> dict:
+    """Translate public feed query parameters into a MongoDB filter.
+
+    Raises ``ValueError`` with a user-facing message on invalid input.
+    """
+    clauses: list[dict] = []
+    if status:
+        clauses.append(
+            {"verification_status": {"$in": _parse_choices(status, PUBLIC_STATUSES, "status")}}
+        )
+    else:
+        clauses.append({"verification_status": {"$ne": "rejected"}})
+    if severity:
+        clauses.append({"severity": {"$in": _parse_choices(severity, SEVERITIES, "severity")}})
+    if bbox:
+        clauses.append(bbox_filter(*parse_bbox(bbox)))
+    if radius_km is not None or lat is not None or lng is not None:
+        if lat is None or lng is None or radius_km is None:
+            raise ValueError("lat, lng and radius_km must be provided together")
+        if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+            raise ValueError("Invalid coordinates")
+        if not (0 < radius_km <= 20000):
+            raise ValueError("radius_km must be between 0 and 20000")
+        clauses.append(radius_filter(lat, lng, radius_km))
+    time_range = {}
+    if since:
+        time_range["$gte"] = _parse_iso(since, "since")
+    if until:
+        time_range["$lte"] = _parse_iso(until, "until")
+    if time_range:
+        clauses.append({"datetime": time_range})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3, "critical": 4}
+CLUSTER_CELLS_PER_TILE = 4
+MAX_CLUSTER_ZOOM = 20
+# Above this zoom cells approach single incidents, so a viewport bbox is required.
+MAX_UNBOUNDED_CLUSTER_ZOOM = 6
+
+
+def cluster_cell_size(zoom: int) -> float:
+    """Grid cell size in degrees: a 256px map tile at ``zoom`` is split into 4x4 cells."""
+    zoom = max(0, min(zoom, MAX_CLUSTER_ZOOM))
+    return 360.0 / (2**zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def cluster_pipeline(query: dict, cell_size: float) -> list[dict]:
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": {
+                    "x": {"$floor": {"$divide": [{"$add": ["$lng", 180]}, cell_size]}},
+                    "y": {"$floor": {"$divide": [{"$add": ["$lat", 90]}, cell_size]}},
+                },
+                "count": {"$sum": 1},
+                "lat": {"$avg": "$lat"},
+                "lng": {"$avg": "$lng"},
+                "max_rank": {
+                    "$max": {
+                        "$switch": {
+                            "branches": [
+                                {"case": {"$eq": ["$severity", sev]}, "then": rank}
+                                for sev, rank in SEVERITY_RANK.items()
+                            ],
+                            "default": 0,
+                        }
+                    }
+                },
+                "incident_id": {"$max": "$id"},
+            }
+        },
+    ]
+
+
+def format_cluster(group: dict, cell_size: float) -> dict:
+    rank_to_severity = {rank: sev for sev, rank in SEVERITY_RANK.items()}
+    min_lng = group["_id"]["x"] * cell_size - 180
+    min_lat = group["_id"]["y"] * cell_size - 90
+    cluster = {
+        "lat": round(group["lat"], 6),
+        "lng": round(group["lng"], 6),
+        "count": group["count"],
+        "max_severity": rank_to_severity.get(group["max_rank"]),
+        "bbox": [min_lng, min_lat, min_lng + cell_size, min_lat + cell_size],
+    }
+    if group["count"] == 1:
+        cluster["incident_id"] = group["incident_id"]
+    return cluster
+
+
+def incident_stats_pipeline() -> list[dict]:
+    """All admin dashboard incident counts in a single pass over the collection."""
+    counts = {"total": {"$sum": 1}}
+    for status in INCIDENT_STATUSES:
+        counts[status] = {"$sum": {"$cond": [{"$eq": ["$verification_status", status]}, 1, 0]}}
+    counts["critical"] = {"$sum": {"$cond": [{"$eq": ["$severity", "critical"]}, 1, 0]}}
+    return [{"$group": {"_id": None, **counts}}, {"$project": {"_id": 0}}]
@@ -4,10 +4,19 @@ from datetime import datetime, timezone
 
 from fastapi import FastAPI
 
-from auth import hash_password, verify_password
+from alerts import backfill_subscriber_locations
+from analytics import ensure_rollups
+from auth import hash_password_async, invalidate_user, verify_password_async
 from config import ALLOW_DEFAULT_ADMIN_PASSWORD
 from db import client, db, ensure_indexes
-from storage import init_storage
+from flag_log import flag_log
+from images import shutdown_image_pool
+from knowledge import warm_knowledge_indexes
+from outbox import email_outbox
+from realtime import start_realtime, stop_realtime
+from services_ai import close_providers
+from services_incidents import backfill_flag_counts, backfill_incident_locations
+from storage import close_storage, init_storage
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +29,19 @@ def resolve_admin_password(admin_password: str | None, allow_default: bool) -> s
 
 async def on_startup() -> None:
     await ensure_indexes()
+    await backfill_incident_locations()
+    await backfill_flag_counts()
+    await backfill_subscriber_locations()
     try:
-        init_storage()
+        await ensure_rollups()
+    except Exception as e:
+        logger.error("Incident rollup build failed: %s", e)
+    warm_knowledge_indexes()
+    await start_realtime()
+    await email_outbox.start()
+    await flag_log.start()
+    try:
+        await init_storage()
     except Exception as e:
         logger.error("Storage init failed: %s", e)
 
@@ -37,7 +57,7 @@ async def on_startup() -> None:
         await db.users.insert_one(
             {
                 "email": admin_email,
-                "password_hash": hash_password(admin_password),
+                "password_hash": await hash_password_async(admin_password),
                 "name": "Admin",
                 "role": "admin",
                 "created_at": datetime.now(timezone.utc).isoformat(),
@@ -46,15 +66,22 @@ async def on_startup() -> None:
         logger.info("Admin seeded: %s", admin_email)
     elif not existing:
         logger.warning("Admin user not seeded because ADMIN_PASSWORD is missing in non-development mode")
-    elif admin_password and not verify_password(admin_password, existing["password_hash"]):
+    elif admin_password and not await verify_password_async(admin_password, existing["password_hash"]):
         await db.users.update_one(
             {"email": admin_email},
-            {"$set": {"password_hash": hash_password(admin_password)}},
+            {"$set": {"password_hash": await hash_password_async(admin_password)}},
         )
+        invalidate_user(str(existing["_id"]))
         logger.info("Admin password updated")
 
 
 async def on_shutdown() -> None:
+    await close_providers()
+    await email_outbox.stop()
+    await flag_log.stop()
+    await close_storage()
+    shutdown_image_pool()
+    await stop_realtime()
     client.close()
 
 
@@ -1,2 +1,3 @@
-ai_tasks: dict = {}
+from task_store import create_task_store
 
+ai_tasks = create_task_store()
@@ -1,60 +1,327 @@
+import asyncio
 import logging
+import mimetypes
 import os
+from abc import ABC, abstractmethod
+from pathlib import Path
 
-import requests as http_requests
+import httpx
 
-STORAGE_URL = os.environ.get("STORAGE_API_URL", "").strip()
 APP_NAME = "safeguard"
-storage_key = None
+CHUNK_SIZE = 64 * 1024
 
 logger = logging.getLogger(__name__)
 
 
-def init_storage():
-    global storage_key
-    if storage_key:
-        return storage_key
-    api_key = os.environ.get("STORAGE_API_KEY")
-    if not api_key:
-        logger.warning("STORAGE_API_KEY not set, storage disabled")
-        return None
-    if not STORAGE_URL:
-        logger.warning("STORAGE_API_URL not set, storage disabled")
-        return None
-    try:
-        resp = http_requests.post(
-            f"{STORAGE_URL}/init", json={"api_key": api_key}, timeout=30
+class ObjectReader:
+    """An open object being streamed; holds a storage slot until closed."""
+
+    def __init__(self, chunks, content_type: str, close):
+        self.content_type = content_type
+        self._chunks = chunks
+        self._close = close
+        self._closed = False
+
+    async def iter_chunks(self):
+        try:
+            async for chunk in self._chunks:
+                yield chunk
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            await self._close()
+
+
+async def _byte_range(chunks, skip: int, limit: int | None):
+    """Drop the first ``skip`` bytes of ``chunks`` and stop after ``limit`` more."""
+    async for chunk in chunks:
+        if skip:
+            if len(chunk) <= skip:
+                skip -= len(chunk)
+                continue
+            chunk, skip = chunk[skip:], 0
+        if limit is not None:
+            chunk = chunk[:limit]
+            limit -= len(chunk)
+        if chunk:
+            yield chunk
+        if limit == 0:
+            return
+
+
+class StorageBackend(ABC):
+    """Async object store with bounded concurrency."""
+
+    name = ""
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def init(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def put(self, path: str, data: bytes, content_type: str) -> dict: ...
+
+    @abstractmethod
+    async def put_stream(self, path: str, chunks, content_type: str) -> dict:
+        """Store an object from an async iterator of byte chunks."""
+
+    @abstractmethod
+    async def get(self, path: str) -> tuple[bytes, str]: ...
+
+    @abstractmethod
+    async def open(self, path: str, start: int = 0, end: int | None = None) -> ObjectReader:
+        """Open bytes ``start``..``end`` (inclusive) of an object for streaming."""
+
+    async def aclose(self) -> None:
+        pass
+
+
+class HTTPStorage(StorageBackend):
+    """The ``STORAGE_API_URL`` object service, over one pooled ``httpx.AsyncClient``."""
+
+    name = "http"
+
+    def __init__(self, url: str, api_key: str | None, max_concurrency: int = 8):
+        super().__init__(max_concurrency)
+        self.url = url
+        self.api_key = api_key
+        self.storage_key: str | None = None
+        self._init_lock = asyncio.Lock()
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            timeout=httpx.Timeout(60, write=120),
+            limits=httpx.Limits(
+                max_connections=max_concurrency, max_keepalive_connections=max_concurrency
+            ),
         )
+
+    async def init(self) -> bool:
+        if self.storage_key:
+            return True
+        if not self.api_key:
+            logger.warning("STORAGE_API_KEY not set, storage disabled")
+            return False
+        if not self.url:
+            logger.warning("STORAGE_API_URL not set, storage disabled")
+            return False
+        async with self._init_lock:
+            if self.storage_key:
+                return True
+            try:
+                resp = await self.client.post("/init", json={"api_key": self.api_key}, timeout=30)
+                resp.raise_for_status()
+                self.storage_key = resp.json()["storage_key"]
+                logger.info("Object storage initialized")
+                return True
+            except Exception as e:
+                logger.error("Storage init failed: %s", e)
+                return False
+
+    async def _key(self) -> str:
+        if not await self.init():
+            raise Exception("Storage not initialized")
+        return self.storage_key
+
+    async def put(self, path: str, data: bytes, content_type: str) -> dict:
+        key = await self._key()
+        async with self._semaphore:
+            resp = await self.client.put(
+                f"/objects/{path}",
+                headers={"X-Storage-Key": key, "Content-Type": content_type},
+                content=data,
+            )
         resp.raise_for_status()
-        storage_key = resp.json()["storage_key"]
-        logger.info("Object storage initialized")
-        return storage_key
-    except Exception as e:
-        logger.error("Storage init failed: %s", e)
-        return None
-
-
-def put_object(path: str, data: bytes, content_type: str) -> dict:
-    key = init_storage()
-    if not key:
-        raise Exception("Storage not initialized")
-    resp = http_requests.put(
-        f"{STORAGE_URL}/objects/{path}",
-        headers={"X-Storage-Key": key, "Content-Type": content_type},
-        data=data,
-        timeout=120,
-    )
-    resp.raise_for_status()
-    return resp.json()
+        return resp.json()
+
+    async def put_stream(self, path: str, chunks, content_type: str) -> dict:
+        # httpx sends an async iterator with chunked transfer encoding.
+        return await self.put(path, chunks, content_type)
+
+    async def get(self, path: str) -> tuple[bytes, str]:
+        key = await self._key()
+        async with self._semaphore:
+            resp = await self.client.get(f"/objects/{path}", headers={"X-Storage-Key": key})
+        resp.raise_for_status()
+        return resp.content, resp.headers.get("Content-Type", "application/octet-stream")
+
+    async def open(self, path: str, start: int = 0, end: int | None = None) -> ObjectReader:
+        key = await self._key()
+        headers = {"X-Storage-Key": key}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        await self._semaphore.acquire()
+        try:
+            request = self.client.build_request("GET", f"/objects/{path}", headers=headers)
+            resp = await self.client.send(request, stream=True)
+            if resp.is_error:
+                await resp.aclose()
+                resp.raise_for_status()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        async def close():
+            await resp.aclose()
+            self._semaphore.release()
+
+        # A service that ignores Range answers 200 with the whole object.
+        skip = start if resp.status_code != 206 else 0
+        limit = None if end is None else end - start + 1
+        return ObjectReader(
+            _byte_range(resp.aiter_bytes(CHUNK_SIZE), skip, limit),
+            resp.headers.get("Content-Type", "application/octet-stream"),
+            close,
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
 
+class LocalStorage(StorageBackend):
+    """Stores objects under a local directory; a stand-in for the HTTP service."""
 
-def get_object(path: str):
-    key = init_storage()
-    if not key:
-        raise Exception("Storage not initialized")
-    resp = http_requests.get(
-        f"{STORAGE_URL}/objects/{path}", headers={"X-Storage-Key": key}, timeout=60
+    name = "local"
+
+    def __init__(self, root: str, max_concurrency: int = 8):
+        super().__init__(max_concurrency)
+        self.root = Path(root).resolve()
+
+    def _resolve(self, path: str) -> Path:
+        target = (self.root / path).resolve()
+        if not target.is_relative_to(self.root):
+            raise ValueError(f"Invalid storage path: {path}")
+        return target
+
+    async def init(self) -> bool:
+        await asyncio.to_thread(self.root.mkdir, parents=True, exist_ok=True)
+        return True
+
+    def _write(self, target: Path, data: bytes) -> None:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(target.name + ".part")
+        partial.write_bytes(data)
+        partial.replace(target)
+
+    async def put(self, path: str, data: bytes, content_type: str) -> dict:
+        target = self._resolve(path)
+        async with self._semaphore:
+            await asyncio.to_thread(self._write, target, data)
+        return {"path": path, "size": len(data)}
+
+    async def put_stream(self, path: str, chunks, content_type: str) -> dict:
+        target = self._resolve(path)
+        partial = target.with_name(target.name + ".part")
+        size = 0
+        async with self._semaphore:
+            await asyncio.to_thread(target.parent.mkdir, parents=True, exist_ok=True)
+            handle = await asyncio.to_thread(partial.open, "wb")
+            try:
+                async for chunk in chunks:
+                    await asyncio.to_thread(handle.write, chunk)
+                    size += len(chunk)
+                await asyncio.to_thread(handle.close)
+                await asyncio.to_thread(partial.replace, target)
+            except BaseException:
+                handle.close()
+                partial.unlink(missing_ok=True)
+                raise
+        return {"path": path, "size": size}
+
+    async def get(self, path: str) -> tuple[bytes, str]:
+        target = self._resolve(path)
+        async with self._semaphore:
+            data = await asyncio.to_thread(target.read_bytes)
+        return data, self._content_type(target)
+
+    def _content_type(self, target: Path) -> str:
+        return mimetypes.guess_type(target.name)[0] or "application/octet-stream"
+
+    async def open(self, path: str, start: int = 0, end: int | None = None) -> ObjectReader:
+        target = self._resolve(path)
+        await self._semaphore.acquire()
+        try:
+            handle = await asyncio.to_thread(target.open, "rb")
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        async def chunks():
+            await asyncio.to_thread(handle.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(handle.read, size)
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+        async def close():
+            await asyncio.to_thread(handle.close)
+            self._semaphore.release()
+
+        return ObjectReader(chunks(), self._content_type(target), close)
+
+
+def create_storage() -> StorageBackend:
+    backend = os.environ.get("STORAGE_BACKEND", "http").strip().lower()
+    max_concurrency = int(os.environ.get("STORAGE_MAX_CONCURRENCY", "8"))
+    if backend == "local":
+        root = os.environ.get("STORAGE_LOCAL_DIR", "./data/storage")
+        return LocalStorage(root, max_concurrency=max_concurrency)
+    if backend != "http":
+        raise ValueError(f"Unsupported STORAGE_BACKEND '{backend}'. Supported: http, local")
+    return HTTPStorage(
+        os.environ.get("STORAGE_API_URL", "").strip(),
+        os.environ.get("STORAGE_API_KEY"),
+        max_concurrency=max_concurrency,
     )
-    resp.raise_for_status()
-    return resp.content, resp.headers.get("Content-Type", "application/octet-stream")
 
+
+_storage: StorageBackend | None = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+
+def set_storage(storage: StorageBackend | None) -> None:
+    global _storage
+    _storage = storage
+
+
+async def init_storage() -> bool:
+    return await get_storage().init()
+
+
+async def close_storage() -> None:
+    global _storage
+    if _storage is not None:
+        await _storage.aclose()
+        _storage = None
+
+
+async def put_object(path: str, data: bytes, content_type: str) -> dict:
+    return await get_storage().put(path, data, content_type)
+
+
+async def put_object_stream(path: str, chunks, content_type: str) -> dict:
+    return await get_storage().put_stream(path, chunks, content_type)
+
+
+async def get_object(path: str) -> tuple[bytes, str]:
+    return await get_storage().get(path)
+
+
+async def open_object(path: str, start: int = 0, end: int | None = None) -> ObjectReader:
+    return await get_storage().open(path, start, end)
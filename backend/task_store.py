@@ -0,0 +1,115 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+
+class TaskStore(ABC):
+    """Storage for AI chat task records, shared by the chat and status endpoints."""
+
+    @abstractmethod
+    async def create(self, task_id: str, task: dict) -> None: ...
+
+    @abstractmethod
+    async def get(self, task_id: str) -> dict | None: ...
+
+    @abstractmethod
+    async def update(self, task_id: str, fields: dict) -> None: ...
+
+
+class MemoryTaskStore(TaskStore):
+    """Process-local LRU store; entries expire ``ttl_seconds`` after their last write.
+
+    Reads move an entry to the end without extending its lifetime, so the order
+    is by use, not expiry: expired entries are found by a periodic full sweep.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600, sweep_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sweep_seconds = sweep_seconds
+        self._tasks: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._next_sweep = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def _evict(self, now: float) -> None:
+        if now >= self._next_sweep:
+            for task_id in [k for k, (expires_at, _) in self._tasks.items() if expires_at <= now]:
+                del self._tasks[task_id]
+            self._next_sweep = now + self.sweep_seconds
+        while len(self._tasks) > self.max_entries:
+            self._tasks.popitem(last=False)
+
+    def _live(self, task_id: str, now: float) -> tuple[float, dict] | None:
+        entry = self._tasks.get(task_id)
+        if entry is not None and entry[0] <= now:
+            del self._tasks[task_id]
+            return None
+        return entry
+
+    async def create(self, task_id: str, task: dict) -> None:
+        now = time.monotonic()
+        self._tasks[task_id] = (now + self.ttl_seconds, dict(task))
+        self._tasks.move_to_end(task_id)
+        self._evict(now)
+
+    async def get(self, task_id: str) -> dict | None:
+        entry = self._live(task_id, time.monotonic())
+        if entry is None:
+            return None
+        self._tasks.move_to_end(task_id)
+        return dict(entry[1])
+
+    async def update(self, task_id: str, fields: dict) -> None:
+        now = time.monotonic()
+        entry = self._live(task_id, now)
+        if entry is None:
+            return
+        entry[1].update(fields)
+        self._tasks[task_id] = (now + self.ttl_seconds, entry[1])
+        self._tasks.move_to_end(task_id)
+        self._evict(now)
+
+
+class MongoTaskStore(TaskStore):
+    """Store shared by every worker; expiry is enforced by a TTL index on ``expires_at``."""
+
+    def __init__(self, collection, ttl_seconds: float = 3600):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    def _expires_at(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+
+    async def create(self, task_id: str, task: dict) -> None:
+        await self.collection.replace_one(
+            {"_id": task_id}, {**task, "expires_at": self._expires_at()}, upsert=True
+        )
+
+    async def get(self, task_id: str) -> dict | None:
+        # The TTL monitor only runs about once a minute, so filter expired records here too.
+        return await self.collection.find_one(
+            {"_id": task_id, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 0, "expires_at": 0},
+        )
+
+    async def update(self, task_id: str, fields: dict) -> None:
+        await self.collection.update_one(
+            {"_id": task_id}, {"$set": {**fields, "expires_at": self._expires_at()}}
+        )
+
+
+def create_task_store() -> TaskStore:
+    backend = os.environ.get("AI_TASK_STORE", "memory").strip().lower()
+    ttl_seconds = float(os.environ.get("AI_TASK_TTL_SECONDS", "3600"))
+    if backend == "mongo":
+        from db import db
+
+        return MongoTaskStore(db.ai_tasks, ttl_seconds=ttl_seconds)
+    if backend != "memory":
+        raise ValueError(f"Unsupported AI_TASK_STORE '{backend}'. Supported: memory, mongo")
+    max_entries = int(os.environ.get("AI_TASK_MAX_ENTRIES", "10000"))
+    return MemoryTaskStore(max_entries=max_entries, ttl_seconds=ttl_seconds)
@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import admin_stats as admin
+from services_incidents import incident_stats_pipeline
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+
+def _fake_db(calls, incident_counts):
+    class Incidents:
+        def aggregate(self, pipeline):
+            calls.append("incidents")
+            return _Cursor(incident_counts)
+
+    class Counted:
+        def __init__(self, name, count):
+            self.name, self.count = name, count
+
+        async def count_documents(self, query):
+            calls.append(self.name)
+            return self.count
+
+    class FakeDb:
+        incidents = Incidents()
+        subscribers = Counted("subscribers", 4)
+        resources = Counted("resources", 9)
+
+    return FakeDb
+
+
+def test_stats_pipeline_counts_every_status_in_one_group():
+    group = incident_stats_pipeline()[0]["$group"]
+    assert set(group) == {"_id", "total", "unverified", "verified", "flagged", "rejected", "critical"}
+
+
+def test_stats_are_computed_once_per_ttl(monkeypatch):
+    calls = []
+    counts = [{"total": 3, "unverified": 1, "verified": 1, "flagged": 0, "rejected": 1, "critical": 2}]
+    monkeypatch.setattr(admin, "db", _fake_db(calls, counts))
+    admin.invalidate_admin_stats()
+
+    async def run():
+        first, second = await asyncio.gather(admin.get_admin_stats(), admin.get_admin_stats())
+        admin.invalidate_admin_stats()
+        await admin.get_admin_stats()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"incidents": counts[0], "subscribers": 4, "resources": 9}
+    assert calls.count("incidents") == 2
+
+
+def test_empty_collection_reports_zero_counts(monkeypatch):
+    monkeypatch.setattr(admin, "db", _fake_db([], []))
+    admin.invalidate_admin_stats()
+    stats = asyncio.run(admin.get_admin_stats())
+    assert stats["incidents"]["total"] == 0
+    assert stats["incidents"]["rejected"] == 0
@@ -0,0 +1,62 @@
+import asyncio
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import alerts
+
+
+INCIDENT = {"id": 7, "lat": 15.5, "lng": 32.5, "severity": "high", "verification_status": "verified"}
+
+
+def test_alert_email_mentions_distance_and_severity():
+    subscriber = {"id": "s1", "email": "a@example.org", "name": "A", "distance_m": 2500}
+    mail = alerts._alert_email(subscriber, INCIDENT)
+    assert mail["to_email"] == "a@example.org"
+    assert "high incident 2.5 km away" in mail["subject"]
+
+
+def test_triggers_default_to_verified(monkeypatch):
+    monkeypatch.delenv("ALERT_TRIGGERS", raising=False)
+    assert alerts.alert_triggers() == {"verified"}
+    monkeypatch.setenv("ALERT_TRIGGERS", "created, Verified")
+    assert alerts.alert_triggers() == {"created", "verified"}
+
+
+def test_schedule_skips_disabled_trigger(monkeypatch):
+    monkeypatch.setenv("ALERT_TRIGGERS", "verified")
+    calls = []
+
+    async def fake_dispatch(incident):
+        calls.append(incident["id"])
+
+    monkeypatch.setattr(alerts, "dispatch_incident_alerts", fake_dispatch)
+
+    async def run():
+        alerts.schedule_incident_alerts(INCIDENT, "created")
+        alerts.schedule_incident_alerts(INCIDENT, "verified")
+        await asyncio.gather(*alerts._dispatch_tasks)
+
+    asyncio.run(run())
+    assert calls == [7]
+
+
+def test_dispatch_queues_one_email_per_matched_subscriber(monkeypatch):
+    async def fake_near(lat, lng):
+        return [
+            {"id": "s1", "email": "a@example.org", "name": "A", "distance_m": 1000},
+            {"id": "s2", "email": "b@example.org", "name": "B", "distance_m": 4000},
+        ]
+
+    queued = []
+
+    async def fake_enqueue_many(mails):
+        queued.extend(mails)
+        return len(mails)
+
+    monkeypatch.setattr(alerts, "find_subscribers_near", fake_near)
+    monkeypatch.setattr(alerts.email_outbox, "enqueue_many", fake_enqueue_many)
+
+    assert asyncio.run(alerts.dispatch_incident_alerts(INCIDENT)) == 2
+    assert [mail["dedup_key"] for mail in queued] == ["alert:s1:7", "alert:s2:7"]
@@ -0,0 +1,83 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import pytest
+
+import analytics
+
+
+class _RollupCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            doc = request._doc
+            key = request._filter["_id"]
+            row = self.docs.setdefault(key, dict(doc["$setOnInsert"], count=0))
+            row["count"] += doc["$inc"]["count"]
+
+
+class _FakeDb(dict):
+    def __missing__(self, name):
+        self[name] = _RollupCollection()
+        return self[name]
+
+
+INCIDENT = {"id": 7, "datetime": "2024-03-05T14:35:00+02:00", "lat": 15.6, "lng": -32.5, "severity": "high"}
+
+
+def test_region_key_uses_south_west_corner():
+    assert analytics.region_key(15.6, 32.54) == "10:30"
+    assert analytics.region_key(-0.5, -179.9) == "-10:-180"
+
+
+def test_status_change_moves_incident_between_cells(monkeypatch):
+    fake_db = _FakeDb()
+    monkeypatch.setattr(analytics, "db", fake_db)
+
+    async def run():
+        await analytics.record_incident_change(INCIDENT, None, "unverified")
+        await analytics.record_incident_change(INCIDENT, "unverified", "verified")
+
+    asyncio.run(run())
+    hourly = fake_db["incident_rollups_hourly"].docs
+    assert hourly["2024-03-05T12|high|unverified|10:-40"]["count"] == 0
+    verified = hourly["2024-03-05T12|high|verified|10:-40"]
+    assert verified["count"] == 1
+    assert verified["bucket"] == datetime(2024, 3, 5, 12, tzinfo=timezone.utc)
+    daily = fake_db["incident_rollups_daily"].docs
+    assert daily["2024-03-05|high|verified|10:-40"]["count"] == 1
+
+
+def test_series_pipeline_filters_and_groups():
+    pipeline = analytics.build_series_pipeline(
+        "hour",
+        since="2024-03-01T10:30:00Z",
+        until="2024-03-02T00:00:00Z",
+        group_by="severity",
+        status="verified,flagged",
+    )
+    match = pipeline[0]["$match"]
+    assert match["bucket"]["$gte"] == datetime(2024, 3, 1, 10, tzinfo=timezone.utc)
+    assert match["status"] == {"$in": ["verified", "flagged"]}
+    assert pipeline[1]["$group"]["_id"] == {"bucket": "$bucket", "severity": "$severity"}
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"interval": "week"},
+        {"group_by": "source"},
+        {"since": "yesterday"},
+        {"since": "2024-03-02T00:00:00Z", "until": "2024-03-01T00:00:00Z"},
+        {"interval": "hour", "since": "2023-01-01T00:00:00Z", "until": "2024-01-01T00:00:00Z"},
+    ],
+)
+def test_series_pipeline_rejects_bad_input(kwargs):
+    with pytest.raises(ValueError):
+        analytics.build_series_pipeline(**kwargs)
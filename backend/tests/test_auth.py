@@ -0,0 +1,117 @@
+import asyncio
+import os
+import threading
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+os.environ.setdefault("JWT_SECRET", "test-secret-for-the-auth-suite-0123456789")
+
+import bcrypt
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import auth
+import routers.auth as auth_routes
+
+
+def test_hashing_runs_off_the_event_loop_thread(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    threads = []
+    real_hash = auth.hash_password
+
+    def recording_hash(password):
+        threads.append(threading.current_thread().name)
+        return real_hash(password)
+
+    monkeypatch.setattr(auth, "hash_password", recording_hash)
+
+    async def run():
+        hashed = await auth.hash_password_async("s3cret")
+        return hashed, await auth.verify_password_async("s3cret", hashed)
+
+    hashed, ok = asyncio.run(run())
+    assert ok
+    assert hashed.startswith("$2b$04$")
+    assert threads and threads[0].startswith("bcrypt")
+
+
+def test_rehash_is_needed_when_cost_changes(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    assert not auth.password_needs_rehash("$2b$05$" + "a" * 53)
+    assert auth.password_needs_rehash("$2b$04$" + "a" * 53)
+    assert auth.password_needs_rehash("not-a-bcrypt-hash")
+
+
+def test_login_upgrades_hash_to_configured_cost(monkeypatch):
+    old_hash = bcrypt.hashpw(b"s3cret", bcrypt.gensalt(4)).decode()
+    user = {"_id": "64b7f0c2a1b2c3d4e5f60718", "email": "a@example.org", "password_hash": old_hash}
+
+    class FakeUsers:
+        async def find_one(self, query):
+            return dict(user) if query["email"] == user["email"] else None
+
+        async def update_one(self, query, update):
+            user.update(update["$set"])
+
+    class FakeDb:
+        users = FakeUsers()
+
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    monkeypatch.setattr(auth_routes, "db", FakeDb)
+    app = FastAPI()
+    app.include_router(auth_routes.router)
+    client = TestClient(app)
+
+    assert client.post("/api/auth/login", json={"email": "a@example.org", "password": "nope"}).status_code == 401
+    assert user["password_hash"] == old_hash
+    assert client.post("/api/auth/login", json={"email": "a@example.org", "password": "s3cret"}).status_code == 200
+    assert user["password_hash"].startswith("$2b$05$")
+    assert bcrypt.checkpw(b"s3cret", user["password_hash"].encode())
+
+
+def _request_with(token):
+    from starlette.requests import Request
+
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+    return Request({"type": "http", "headers": headers, "method": "GET", "path": "/"})
+
+
+def test_resolved_users_are_cached_until_logout(monkeypatch):
+    user_id = "64b7f0c2a1b2c3d4e5f60718"
+    lookups = []
+
+    class FakeUsers:
+        async def find_one(self, query, projection=None):
+            lookups.append(query)
+            return {"_id": query["_id"], "email": "a@example.org", "role": "admin"}
+
+    class FakeDb:
+        users = FakeUsers()
+
+    monkeypatch.setattr(auth, "db", FakeDb)
+    auth.invalidate_user()
+    request = _request_with(auth.create_access_token(user_id, "a@example.org", "admin"))
+
+    async def run():
+        first = await auth.require_admin(request)
+        first["role"] = "tampered"
+        second = await auth.require_admin(request)
+        auth.logout_user(request)
+        await auth.get_current_user(request)
+        return second
+
+    second = asyncio.run(run())
+    assert second["_id"] == user_id
+    assert second["role"] == "admin"
+    assert len(lookups) == 2
+
+
+def test_stateless_mode_trusts_signed_role_claim(monkeypatch):
+    class NoDb:
+        users = None
+
+    monkeypatch.setattr(auth, "db", NoDb)
+    monkeypatch.setattr(auth, "AUTH_STATELESS", True)
+    token = auth.create_access_token("64b7f0c2a1b2c3d4e5f60718", "a@example.org", "admin", "Ada")
+    user = asyncio.run(auth.require_admin(_request_with(token)))
+    assert user == {"_id": "64b7f0c2a1b2c3d4e5f60718", "email": "a@example.org", "name": "Ada", "role": "admin"}
@@ -0,0 +1,143 @@
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from feed_cache import etag_matches, incident_feed_cache, invalidate_incident_feed
+from routers.incidents import router
+
+
+def _client(monkeypatch, calls):
+    async def fake_page(collection, query, limit, cursor=None, fields=None):
+        calls.append(query)
+        return [{"id": 1, "lat": 15.5, "lng": 32.5}], None
+
+    async def fake_change_state():
+        return 7, 0
+
+    async def fake_settled(floor=0):
+        return 7
+
+    monkeypatch.setattr("routers.incidents.fetch_incident_page", fake_page)
+    monkeypatch.setattr("routers.incidents.current_change_state", fake_change_state)
+    monkeypatch.setattr("routers.incidents.settled_change_seq", fake_settled)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_feed_is_served_from_cache_until_invalidated(monkeypatch):
+    asyncio.run(invalidate_incident_feed())
+    calls = []
+    client = _client(monkeypatch, calls)
+
+    first = client.get("/api/incidents/?severity=high&limit=10")
+    second = client.get("/api/incidents/?limit=10&severity=high")
+    assert first.json() == second.json() == [{"id": 1, "lat": 15.5, "lng": 32.5}]
+    assert len(calls) == 1
+    assert first.headers["x-change-seq"] == "7"
+
+    not_modified = client.get("/api/incidents/?severity=high&limit=10", headers={"If-None-Match": first.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert len(calls) == 1
+
+    asyncio.run(invalidate_incident_feed())
+    client.get("/api/incidents/?severity=high&limit=10")
+    assert len(calls) == 2
+
+
+def test_etag_matching_handles_lists_and_weak_tags():
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"xyz"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert incident_feed_cache.max_entries > 0
+
+
+class _FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, n):
+        return self.docs[:n]
+
+
+class _FakeIncidents:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        since = query["change_seq"]["$gt"]
+        return _FakeCursor([dict(d) for d in self.docs if d["change_seq"] > since])
+
+
+def _changes_client(monkeypatch, docs, seq, floor, settled):
+    class FakeDb:
+        incidents = _FakeIncidents(docs)
+
+    async def fake_change_state():
+        return seq, floor
+
+    async def fake_settled(floor=0):
+        return settled
+
+    monkeypatch.setattr("routers.incidents.db", FakeDb)
+    monkeypatch.setattr("routers.incidents.current_change_state", fake_change_state)
+    monkeypatch.setattr("routers.incidents.settled_change_seq", fake_settled)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_changes_endpoint_returns_delta_and_removed_ids(monkeypatch):
+    docs = [
+        {"id": 1, "change_seq": 3, "verification_status": "verified", "lat": 1.0},
+        {"id": 2, "change_seq": 5, "verification_status": "rejected", "lat": 2.0},
+        {"id": 3, "change_seq": 6, "verification_status": "unverified", "lat": 3.0},
+    ]
+    client = _changes_client(monkeypatch, docs, seq=6, floor=2, settled=6)
+
+    delta = client.get("/api/incidents/changes?since=4").json()
+    assert delta["seq"] == 6 and delta["has_more"] is False
+    assert [d["id"] for d in delta["changed"]] == [3]
+    assert delta["removed"] == [2]
+
+    assert client.get("/api/incidents/changes?since=1").json()["reset"] is True
+    assert client.get("/api/incidents/changes?since=2&limit=1").json()["seq"] == 3
+    assert client.get("/api/incidents/changes?since=6").json()["seq"] == 6
+
+
+def test_changes_cursor_stays_behind_unsettled_changes(monkeypatch):
+    # Seq 5 was allocated but its write has not landed; seq 6 already has.
+    docs = [
+        {"id": 1, "change_seq": 3, "verification_status": "verified"},
+        {"id": 3, "change_seq": 6, "verification_status": "unverified"},
+    ]
+    client = _changes_client(monkeypatch, docs, seq=6, floor=0, settled=4)
+
+    delta = client.get("/api/incidents/changes?since=2").json()
+    assert [d["id"] for d in delta["changed"]] == [1, 3]
+    assert delta["seq"] == 4
+
+    page = client.get("/api/incidents/changes?since=3&limit=1").json()
+    assert page["seq"] == 4 and page["has_more"] is False
+
+
+def test_high_zoom_clusters_require_bbox(monkeypatch):
+    client = _client(monkeypatch, [])
+    response = client.get("/api/incidents/clusters?zoom=12")
+    assert response.status_code == 422
+    assert "bbox" in response.json()["message"]
@@ -0,0 +1,169 @@
+import io
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import routers.files as files
+import storage
+from images import render_variants
+from routers.files import parse_range
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    def _match(self, query):
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in query.items()):
+                return doc
+        return None
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    async def update_one(self, query, update):
+        doc = self._match(query)
+        if doc is not None:
+            doc.update(update.get("$set", {}))
+            for field, delta in update.get("$inc", {}).items():
+                doc[field] = doc.get(field, 0) + delta
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        if self._match(query) is None and upsert:
+            self.docs.append({**query, **update.get("$setOnInsert", {})})
+        await self.update_one(query, update)
+        doc = self._match(query)
+        return dict(doc) if doc is not None else None
+
+    async def find_one(self, query, projection=None):
+        doc = self._match(query)
+        return dict(doc) if doc is not None else None
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    class FakeDb:
+        files = _FakeCollection()
+        blobs = _FakeCollection()
+
+    monkeypatch.setattr(files, "db", FakeDb)
+
+    async def inline_variants(data):
+        return render_variants(data)
+
+    monkeypatch.setattr(files, "generate_variants", inline_variants)
+    storage.set_storage(storage.LocalStorage(str(tmp_path)))
+    app = FastAPI()
+    app.include_router(files.router)
+    test_client = TestClient(app)
+    test_client.fake_db = FakeDb
+    yield test_client
+    storage.set_storage(None)
+
+
+def test_parse_range_forms():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=95-500", 100) == (95, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_upload_then_stream_with_range_and_etag(client):
+    payload = bytes(range(256)) * 1024
+    uploaded = client.post("/api/upload/", files={"file": ("photo.png", payload, "image/png")})
+    assert uploaded.status_code == 200
+    url = uploaded.json()["url"]
+
+    full = client.get(url)
+    assert full.status_code == 200
+    assert full.content == payload
+    assert full.headers["accept-ranges"] == "bytes"
+    assert "immutable" in full.headers["cache-control"]
+
+    partial = client.get(url, headers={"Range": "bytes=1000-1999"})
+    assert partial.status_code == 206
+    assert partial.content == payload[1000:2000]
+    assert partial.headers["content-range"] == f"bytes 1000-1999/{len(payload)}"
+
+    assert client.get(url, headers={"If-None-Match": full.headers["etag"]}).status_code == 304
+    assert client.get(url, headers={"Range": f"bytes={len(payload)}-"}).status_code == 416
+
+
+def test_oversized_upload_is_rejected(client, tmp_path):
+    payload = b"x" * (files.MAX_FILE_SIZE + 1)
+    response = client.post("/api/upload/", files={"file": ("big.png", payload, "image/png")})
+    assert response.status_code == 400
+    assert response.json() == {"error": "File too large. Max 10MB"}
+    assert not [p for p in tmp_path.rglob("*") if p.is_file()]
+
+
+def _jpeg_with_exif(size=(1600, 1200)) -> bytes:
+    image = Image.new("RGB", size, (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"  # Make
+    out = io.BytesIO()
+    image.save(out, format="JPEG", exif=exif)
+    return out.getvalue()
+
+
+def test_variants_are_small_webp_without_exif():
+    variants = render_variants(_jpeg_with_exif())
+    assert set(variants) == {"thumb", "medium"}
+    with Image.open(io.BytesIO(variants["thumb"])) as thumb:
+        assert thumb.format == "WEBP"
+        assert max(thumb.size) == 256
+        assert not thumb.getexif()
+    with Image.open(io.BytesIO(variants["medium"])) as medium:
+        assert max(medium.size) == 1024
+
+
+def test_variant_is_served_from_the_file_record(client):
+    uploaded = client.post("/api/upload/", files={"file": ("p.jpg", _jpeg_with_exif(), "image/jpeg")})
+    url = uploaded.json()["url"]
+
+    thumb = client.get(url, params={"variant": "thumb"})
+    assert thumb.status_code == 200
+    assert thumb.headers["content-type"] == "image/webp"
+    assert thumb.headers["etag"].endswith('-thumb"')
+    assert len(thumb.content) < len(client.get(url).content)
+    assert client.get(url, params={"variant": "huge"}).status_code == 400
+
+
+def test_failed_variant_falls_back_without_long_lived_caching(client, monkeypatch):
+    payload = b"not really an image"
+    url = client.post("/api/upload/", files={"file": ("p.png", payload, "image/png")}).json()["url"]
+
+    async def broken_variants(data):
+        raise OSError("cannot identify image file")
+
+    monkeypatch.setattr(files, "generate_variants", broken_variants)
+    fallback = client.get(url, params={"variant": "thumb"})
+    assert fallback.status_code == 200
+    assert fallback.content == payload
+    assert fallback.headers["cache-control"] == "no-store"
+    assert fallback.headers["etag"] not in (client.get(url).headers["etag"], f'"{url.split("/")[-1]}-thumb"')
+
+
+def test_identical_uploads_share_one_blob(client, tmp_path):
+    photo = _jpeg_with_exif((64, 48))
+    first = client.post("/api/upload/", files={"file": ("a.jpg", photo, "image/jpeg")}).json()
+    second = client.post("/api/upload/", files={"file": ("b.jpg", photo, "image/jpeg")}).json()
+
+    assert first["id"] != second["id"]
+    assert first["sha256"] == second["sha256"]
+    assert (first["duplicate"], second["duplicate"]) == (False, True)
+    assert first["path"] == second["path"]
+    assert client.fake_db.blobs.docs[0]["ref_count"] == 2
+    assert len(list((tmp_path / "safeguard" / "blobs").rglob("*.jpg"))) == 1
+    assert client.get(second["url"]).content == photo
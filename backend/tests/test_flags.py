@@ -0,0 +1,136 @@
+import asyncio
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError
+
+import routers.incidents as incidents
+from flag_log import FlagLog
+from services_incidents import FLAG_THRESHOLD, flag_update_pipeline
+
+
+class _FlagCollection:
+    def __init__(self, fail_times=0):
+        self.docs = []
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def insert_many(self, docs, ordered=True):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("mongo unavailable")
+        self.batches.append(len(docs))
+        self.docs.extend(docs)
+
+
+class _Incidents:
+    """Applies ``flag_update_pipeline`` semantics and returns the prior document."""
+
+    def __init__(self, docs):
+        self.docs = {doc["id"]: doc for doc in docs}
+        self.writes = 0
+        self.updates = []
+
+    async def find_one_and_update(self, query, update, projection=None):
+        self.writes += 1
+        doc = self.docs.get(query["id"])
+        if doc is None:
+            return None
+        before = dict(doc)
+        doc["flag_count"] = doc.get("flag_count", 0) + 1
+        if doc["flag_count"] >= FLAG_THRESHOLD and doc["verification_status"] == "unverified":
+            doc["verification_status"] = "flagged"
+        return before
+
+    async def update_one(self, query, update):
+        self.updates.append(update)
+        self.docs[query["id"]].update(update["$set"])
+
+
+def test_flag_pipeline_counts_before_applying_threshold():
+    count_stage, status_stage = flag_update_pipeline()
+    assert count_stage["$set"]["flag_count"] == {"$add": [{"$ifNull": ["$flag_count", 0]}, 1]}
+    condition = status_stage["$set"]["verification_status"]["$cond"]
+    assert condition[0]["$and"][0] == {"$gte": ["$flag_count", FLAG_THRESHOLD]}
+    assert condition[1:] == ["flagged", "$verification_status"]
+
+
+def test_flag_log_writes_in_batches():
+    log = FlagLog(_FlagCollection(), batch_size=2)
+    for i in range(5):
+        log.append({"incident_id": i})
+    assert asyncio.run(log.flush()) == 5
+    assert log.collection.batches == [2, 2, 1]
+    assert len(log) == 0
+
+
+def test_flag_log_keeps_records_when_a_write_fails():
+    log = FlagLog(_FlagCollection(fail_times=1), batch_size=10)
+    log.append({"incident_id": 1})
+    with pytest.raises(ConnectionError):
+        asyncio.run(log.flush())
+    assert len(log) == 1
+    assert asyncio.run(log.flush()) == 1
+
+
+def test_flag_log_treats_duplicates_from_a_partial_write_as_done():
+    class PartlyStored(_FlagCollection):
+        async def insert_many(self, docs, ordered=True):
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}], "nInserted": 1})
+
+    log = FlagLog(PartlyStored(), batch_size=10)
+    log.append({"incident_id": 1})
+    log.append({"incident_id": 2})
+    assert asyncio.run(log.flush()) == 1
+    assert len(log) == 0
+
+
+def test_flag_log_drops_oldest_when_full():
+    log = FlagLog(_FlagCollection(), max_buffered=2)
+    for i in range(3):
+        log.append({"incident_id": i})
+    asyncio.run(log.flush())
+    assert [doc["incident_id"] for doc in log.collection.docs] == [1, 2]
+
+
+def test_third_flag_marks_incident_flagged_once(monkeypatch):
+    fake_incidents = _Incidents([{"id": 1, "verification_status": "unverified", "flag_count": 0}])
+    log = FlagLog(_FlagCollection())
+    changes = []
+
+    seqs = iter(range(40, 50))
+
+    async def next_change():
+        return {"change_seq": next(seqs), "changed_at": 0.0}
+
+    async def invalidate_incident_feed():
+        pass
+
+    async def record_incident_change(incident, old_status, new_status):
+        changes.append((old_status, new_status))
+
+    monkeypatch.setattr(incidents, "db", type("FakeDb", (), {"incidents": fake_incidents}))
+    monkeypatch.setattr(incidents, "flag_log", log)
+    monkeypatch.setattr(incidents, "next_change", next_change)
+    monkeypatch.setattr(incidents, "invalidate_incident_feed", invalidate_incident_feed)
+    monkeypatch.setattr(incidents, "record_incident_change", record_incident_change)
+    monkeypatch.setattr(incidents, "invalidate_admin_stats", lambda: changes.append("stats"))
+    app = FastAPI()
+    app.include_router(incidents.router)
+    client = TestClient(app)
+
+    results = [client.post("/api/incidents/1/flag/", json={"reason": "spam"}).json() for _ in range(4)]
+
+    assert [r["flag_count"] for r in results] == [1, 2, 3, 4]
+    assert [r["verification_status"] for r in results] == ["unverified", "unverified", "flagged", "flagged"]
+    assert fake_incidents.writes == 4
+    # Only the flipping flag allocates a change number.
+    assert fake_incidents.updates == [{"$set": {"change_seq": 40, "changed_at": 0.0}}]
+    assert changes == ["stats", ("unverified", "flagged")]
+    assert len(log) == 4
+    assert client.post("/api/incidents/9/flag/", json={"reason": "spam"}).status_code == 404
@@ -5,12 +5,33 @@ os.environ.setdefault("DB_NAME", "safeguard_test")
 
 import asyncio
 
+import anyio
+import pytest
+
 from routers.seed import seed_allows_destructive_reset, seed_requires_admin
-from services_ai import process_ai_chat
+import services_ai
+from services_ai import process_ai_chat, stream_ai_chat
 from state import ai_tasks
 from startup import resolve_admin_password
 
 
+@pytest.fixture(autouse=True)
+def _empty_response_cache():
+    if services_ai.response_cache is not None:
+        services_ai.response_cache.invalidate()
+
+
+def _new_task():
+    return {
+        "status": "processing",
+        "content": None,
+        "usage": None,
+        "agent_type": "general",
+        "tool_calls": [],
+        "message": "AI is thinking...",
+    }
+
+
 def test_seed_requires_admin_when_public_seed_disabled():
     assert seed_requires_admin(False) is True
 
@@ -41,30 +62,114 @@ def test_ai_provider_switch_to_ollamafreeapi(monkeypatch):
     monkeypatch.setattr("services_ai._run_ollamafreeapi", fake_ollama)
 
     task_id = "t1"
-    ai_tasks[task_id] = {
-        "status": "processing",
-        "content": None,
-        "usage": None,
-        "agent_type": "general",
-        "tool_calls": [],
-        "message": "AI is thinking...",
-    }
+    asyncio.run(ai_tasks.create(task_id, _new_task()))
     asyncio.run(process_ai_chat(task_id, "general", "hello"))
-    assert ai_tasks[task_id]["status"] == "success"
-    assert ai_tasks[task_id]["content"] == "ollama-response"
+    task = asyncio.run(ai_tasks.get(task_id))
+    assert task["status"] == "success"
+    assert task["content"] == "ollama-response"
 
 
 def test_ai_provider_rejects_unsupported_provider(monkeypatch):
     monkeypatch.setenv("AI_PROVIDER", "unknown-provider")
     task_id = "t2"
-    ai_tasks[task_id] = {
-        "status": "processing",
-        "content": None,
-        "usage": None,
-        "agent_type": "general",
-        "tool_calls": [],
-        "message": "AI is thinking...",
-    }
+    asyncio.run(ai_tasks.create(task_id, _new_task()))
     asyncio.run(process_ai_chat(task_id, "general", "hello"))
-    assert ai_tasks[task_id]["status"] == "error"
-    assert "Unsupported AI_PROVIDER" in ai_tasks[task_id]["error"]
+    task = asyncio.run(ai_tasks.get(task_id))
+    assert task["status"] == "error"
+    assert "Unsupported AI_PROVIDER" in task["error"]
+
+
+def test_stream_timeout_covers_upstream_waits_only():
+    async def upstream(delay):
+        yield "a"
+        await asyncio.sleep(delay)
+        yield "b"
+
+    async def slow_consumer():
+        received = []
+        async for chunk in services_ai._chunks_with_timeout(upstream(0), 0.05):
+            received.append(chunk)
+            await asyncio.sleep(0.1)
+        return received
+
+    assert asyncio.run(slow_consumer()) == ["a", "b"]
+
+    async def slow_upstream():
+        return [chunk async for chunk in services_ai._chunks_with_timeout(upstream(1), 0.05)]
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(slow_upstream())
+
+
+def test_ai_stream_appends_medical_disclaimer_and_updates_task(monkeypatch):
+    async def fake_stream(agent_type, message):
+        for token in ["Apply ", "pressure."]:
+            yield token
+
+    async def collect(task_id):
+        return [event async for event in stream_ai_chat(task_id, "medical", "bleeding")]
+
+    monkeypatch.setenv("AI_PROVIDER", "openai")
+    monkeypatch.setattr("services_ai._stream_openai", fake_stream)
+
+    task_id = "t3"
+    asyncio.run(ai_tasks.create(task_id, _new_task()))
+    events = asyncio.run(collect(task_id))
+    deltas = [data["delta"] for event, data in events if event == "token"]
+    assert deltas[:2] == ["Apply ", "pressure."]
+    assert "professional medical help" in deltas[-1]
+    assert events[-1][0] == "done"
+    task = asyncio.run(ai_tasks.get(task_id))
+    assert task["status"] == "success"
+    assert task["content"] == "".join(deltas)
+
+
+def test_ai_stream_closed_by_client_still_finalises_task(monkeypatch):
+    class AsyncStore:
+        def __init__(self):
+            self.tasks = {}
+
+        async def update(self, task_id, fields):
+            await asyncio.sleep(0)
+            self.tasks.setdefault(task_id, {}).update(fields)
+
+    async def fake_stream(agent_type, message):
+        for token in ["Stay ", "low."]:
+            yield token
+
+    async def disconnect():
+        stream = stream_ai_chat("t6", "general", "shelling nearby")
+        # Starlette cancels the response's scope when the client goes away.
+        with anyio.CancelScope() as scope:
+            await stream.__anext__()
+            scope.cancel()
+            await stream.aclose()
+
+    store = AsyncStore()
+    monkeypatch.setenv("AI_PROVIDER", "openai")
+    monkeypatch.setattr("services_ai._stream_openai", fake_stream)
+    monkeypatch.setattr(services_ai, "ai_tasks", store)
+    asyncio.run(disconnect())
+    assert store.tasks["t6"]["status"] == "error"
+
+
+def test_ai_repeated_question_served_from_cache(monkeypatch):
+    calls = []
+
+    async def fake_openai(agent_type, message):
+        calls.append(message)
+        return "Stay low and move to an interior room."
+
+    monkeypatch.setenv("AI_PROVIDER", "openai")
+    monkeypatch.setattr("services_ai._run_openai", fake_openai)
+
+    asyncio.run(ai_tasks.create("t4", _new_task()))
+    asyncio.run(process_ai_chat("t4", "general", "What to do during shelling in Khartoum?"))
+    asyncio.run(ai_tasks.create("t5", _new_task()))
+    asyncio.run(process_ai_chat("t5", "general", "what to do during  shelling in khartoum?"))
+
+    assert len(calls) == 1
+    first, second = asyncio.run(ai_tasks.get("t4")), asyncio.run(ai_tasks.get("t5"))
+    assert first["usage"]["cache_read"] == 0
+    assert second["content"] == first["content"]
+    assert second["usage"]["cache_read"] > 0
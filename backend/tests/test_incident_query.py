@@ -0,0 +1,58 @@
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import pytest
+
+from services_incidents import build_incident_query, cluster_cell_size, format_cluster
+
+
+def test_default_query_hides_rejected():
+    assert build_incident_query() == {"verification_status": {"$ne": "rejected"}}
+
+
+def test_bbox_uses_geo_polygon_and_exact_latitude_range():
+    query = build_incident_query(bbox="30,45,35,52", severity="critical,high")
+    bbox_clause = query["$and"][2]
+    assert bbox_clause["lat"] == {"$gte": 45.0, "$lte": 52.0}
+    ring = bbox_clause["location"]["$geoWithin"]["$geometry"]["coordinates"][0]
+    assert ring[0] == ring[-1] == [30.0, 45.0]
+    assert query["$and"][1] == {"severity": {"$in": ["critical", "high"]}}
+
+
+def test_bbox_across_antimeridian_splits_in_two():
+    clause = build_incident_query(bbox="170,-20,-170,0")["$and"][1]
+    assert len(clause["$or"]) == 2
+
+
+def test_radius_query_requires_center():
+    with pytest.raises(ValueError):
+        build_incident_query(radius_km=10)
+    clause = build_incident_query(lat=15.5, lng=32.5, radius_km=63.71)["$and"][1]
+    center, radians = clause["location"]["$geoWithin"]["$centerSphere"]
+    assert center == [32.5, 15.5]
+    assert radians == pytest.approx(0.01)
+
+
+def test_invalid_filters_raise():
+    with pytest.raises(ValueError):
+        build_incident_query(status="rejected")
+    with pytest.raises(ValueError):
+        build_incident_query(bbox="1,2,3")
+    with pytest.raises(ValueError):
+        build_incident_query(since="yesterday")
+
+
+def test_cluster_cells_shrink_with_zoom_and_format_groups():
+    assert cluster_cell_size(0) == 90.0
+    assert cluster_cell_size(3) == cluster_cell_size(2) / 2
+    assert cluster_cell_size(99) == cluster_cell_size(20)
+
+    cluster = format_cluster(
+        {"_id": {"x": 2, "y": 1}, "count": 1, "lat": 15.5, "lng": 32.5, "max_rank": 4, "incident_id": 9},
+        cell_size=90.0,
+    )
+    assert cluster["max_severity"] == "critical"
+    assert cluster["bbox"] == [0.0, 0.0, 90.0, 90.0]
+    assert cluster["incident_id"] == 9
@@ -0,0 +1,33 @@
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+from knowledge import build_system_prompt
+from knowledge_index import chunk_markdown, format_sections, get_index
+
+
+def test_chunk_markdown_splits_on_headings():
+    chunks = chunk_markdown("x.md", "# Title\n\nintro\n\n## Alpha\nfirst\n\n## Beta\nsecond\n")
+    assert [c["heading"] for c in chunks] == ["Title", "Title > Alpha", "Title > Beta"]
+    assert chunks[1]["text"] == "first"
+
+
+def test_medical_search_ranks_bleeding_first():
+    results = get_index("knowledge/first_aid").search("how to stop severe bleeding tourniquet", 3)
+    assert results
+    assert results[0]["source"] == "bleeding.md"
+
+
+def test_format_sections_respects_token_budget():
+    sections = [{"source": "a.md", "heading": "A", "text": "x" * 400} for _ in range(10)]
+    rendered = format_sections(sections, token_budget=250)
+    assert rendered.count("--- a.md") == 2
+
+
+def test_system_prompt_only_injects_relevant_sections(monkeypatch):
+    monkeypatch.setenv("KNOWLEDGE_TOP_K", "2")
+    prompt = build_system_prompt("medical", "burns treatment cool water")
+    assert "burns.md" in prompt
+    assert prompt.count("\n--- ") <= 2
+    assert "{knowledge}" not in prompt
@@ -0,0 +1,196 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import InsertManyResult
+
+import mailer
+from outbox import EmailOutbox
+
+
+class FakeOutboxCollection:
+    """Just enough of a collection for enqueue and result bookkeeping."""
+
+    def __init__(self):
+        self.docs = {}
+        self.writes = []
+
+    async def insert_one(self, doc):
+        if doc["dedup_key"] in self.docs:
+            raise DuplicateKeyError("duplicate dedup_key")
+        doc["_id"] = doc["dedup_key"]
+        self.docs[doc["dedup_key"]] = doc
+
+    async def insert_many(self, docs, ordered=True):
+        inserted, errors = 0, []
+        for index, doc in enumerate(docs):
+            try:
+                await self.insert_one(doc)
+                inserted += 1
+            except DuplicateKeyError:
+                errors.append({"index": index, "code": 11000})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": inserted})
+        return InsertManyResult([doc["_id"] for doc in docs], acknowledged=True)
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            doc = self.docs[request._filter["_id"]]
+            doc.update(request._doc["$set"])
+            for field in request._doc["$unset"]:
+                doc.pop(field, None)
+            self.writes.append(request)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction=1):
+        self.docs = sorted(self.docs, key=lambda doc: doc[field])
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length):
+        return [dict(doc) for doc in self.docs]
+
+
+class ClaimingOutboxCollection(FakeOutboxCollection):
+    """Adds the find/update_many queries ``claim_batch`` issues."""
+
+    def __init__(self):
+        super().__init__()
+        self.claim_writes = 0
+
+    def _claimable(self, doc, now):
+        if doc["status"] == "pending":
+            return doc["next_attempt_at"] <= now
+        return doc["status"] == "sending" and doc["lease_until"] <= now
+
+    def find(self, query, projection=None):
+        if "lease" in query:
+            return _Cursor([d for d in self.docs.values() if d.get("lease") == query["lease"]])
+        now = query["$or"][0]["next_attempt_at"]["$lte"]
+        return _Cursor([d for d in self.docs.values() if self._claimable(d, now)])
+
+    async def update_many(self, query, update):
+        self.claim_writes += 1
+        now = query["$or"][0]["next_attempt_at"]["$lte"]
+        for key in query["_id"]["$in"]:
+            if self._claimable(self.docs[key], now):
+                self.docs[key].update(update["$set"])
+
+
+def _mail(key, email="a@example.org"):
+    return {"dedup_key": key, "to_email": email, "to_name": "A", "subject": "s", "body": "b"}
+
+
+@pytest.fixture
+def transport():
+    fake = mailer.FakeTransport()
+    mailer.set_mail_transport(fake)
+    yield fake
+    mailer.set_mail_transport(None)
+
+
+def _outbox(collection, **kwargs):
+    outbox = EmailOutbox(collection, **kwargs)
+
+    async def claim_batch():
+        pending = [d for d in collection.docs.values() if d["status"] == "pending"]
+        return pending[: outbox.batch_size]
+
+    outbox.claim_batch = claim_batch
+    return outbox
+
+
+def test_enqueue_dedups_on_key():
+    collection = FakeOutboxCollection()
+    outbox = EmailOutbox(collection)
+
+    async def run():
+        first = await outbox.enqueue(_mail("alert:s1:7"))
+        again = await outbox.enqueue(_mail("alert:s1:7"))
+        many = await outbox.enqueue_many([_mail("alert:s1:7"), _mail("alert:s2:7")])
+        return first, again, many
+
+    assert asyncio.run(run()) == (True, False, 1)
+    assert sorted(collection.docs) == ["alert:s1:7", "alert:s2:7"]
+
+
+def test_batch_is_sent_through_transport(transport):
+    collection = FakeOutboxCollection()
+    outbox = _outbox(collection, batch_size=10)
+
+    async def run():
+        await outbox.enqueue_many([_mail("k1"), _mail("k2", "b@example.org")])
+        return await outbox.process_batch()
+
+    assert asyncio.run(run()) == 2
+    assert [mail["to_email"] for mail in transport.sent] == ["a@example.org", "b@example.org"]
+    assert {doc["status"] for doc in collection.docs.values()} == {"sent"}
+    assert all("purge_at" in doc for doc in collection.docs.values())
+
+
+def test_failures_back_off_then_give_up(transport):
+    transport.fail_with = "provider down"
+    collection = FakeOutboxCollection()
+    outbox = _outbox(collection, max_attempts=2, retry_base_seconds=10)
+
+    async def run():
+        await outbox.enqueue(_mail("k1"))
+        await outbox.process_batch()
+        first = dict(collection.docs["k1"])
+        await outbox.process_batch()
+        return first, collection.docs["k1"]
+
+    first, final = asyncio.run(run())
+    assert first["status"] == "pending"
+    assert first["attempts"] == 1
+    assert first["next_attempt_at"] > first["created_at"]
+    assert final["status"] == "failed"
+    assert final["last_error"] == "provider down"
+    assert transport.sent == []
+
+
+def test_claim_batch_claims_in_bulk_and_skips_leased_mail():
+    collection = ClaimingOutboxCollection()
+    outbox = EmailOutbox(collection, batch_size=2)
+    other = EmailOutbox(collection, batch_size=2)
+
+    async def run():
+        await outbox.enqueue_many([_mail("k1"), _mail("k2"), _mail("k3")])
+        later = datetime.now(timezone.utc) + timedelta(minutes=5)
+        collection.docs["k1"].update(status="sending", lease_until=later)
+        first = await outbox.claim_batch()
+        second = await other.claim_batch()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [doc["_id"] for doc in first] == ["k2", "k3"]
+    assert {doc["worker"] for doc in first} == {outbox.worker_id}
+    assert second == []
+    assert collection.claim_writes == 1
+
+
+def test_transport_sends_a_batch_concurrently():
+    transport = mailer.FakeTransport()
+    transport.max_concurrency = 4
+    mails = [{"to_email": f"{i}@example.org", "to_name": "A", "subject": "s", "body": "b"} for i in range(6)]
+    assert transport.send_batch(mails) == [(True, "sent")] * 6
+    assert sorted(mail["to_email"] for mail in transport.sent) == sorted(mail["to_email"] for mail in mails)
+
+
+def test_retry_delay_grows_and_is_capped():
+    outbox = EmailOutbox(FakeOutboxCollection(), retry_base_seconds=10, retry_max_seconds=60)
+    assert 8 <= outbox.retry_delay(1) <= 12
+    assert 32 <= outbox.retry_delay(3) <= 48
+    assert outbox.retry_delay(10) <= 72
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from pagination import (
+    decode_cursor,
+    encode_cursor,
+    fetch_incident_page,
+    incident_projection,
+    keyset_filter,
+    parse_fields,
+)
+
+
+class _FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, n):
+        return self.docs[:n]
+
+
+class _FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, projection):
+        self.queries.append(query)
+        docs = list(self.docs)
+        if query:
+            dt, incident_id = query["$or"][1]["datetime"], query["$or"][1]["id"]["$lt"]
+            docs = [d for d in docs if (d["datetime"], d["id"]) < (dt, incident_id)]
+        return _FakeCursor(docs)
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    cursor = encode_cursor({"datetime": "2026-04-14T10:30:00+00:00", "id": 42})
+    assert decode_cursor(cursor) == ("2026-04-14T10:30:00+00:00", 42)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_keyset_filter_breaks_datetime_ties_by_id():
+    cursor = encode_cursor({"datetime": "2026-01-01T00:00:00+00:00", "id": 7})
+    assert keyset_filter(cursor) == {
+        "$or": [
+            {"datetime": {"$lt": "2026-01-01T00:00:00+00:00"}},
+            {"datetime": "2026-01-01T00:00:00+00:00", "id": {"$lt": 7}},
+        ]
+    }
+
+
+def test_fields_projection_always_fetches_sort_keys():
+    assert parse_fields("id,lat,lng,severity") == ["id", "lat", "lng", "severity"]
+    projection = incident_projection(["lat", "lng"])
+    assert projection["datetime"] == 1 and projection["id"] == 1
+    with pytest.raises(ValueError):
+        parse_fields("password_hash")
+
+
+def test_feed_projection_leaves_out_flag_count():
+    assert incident_projection(None)["flag_count"] == 0
+    with pytest.raises(ValueError):
+        parse_fields("flag_count")
+
+
+def test_admin_projection_keeps_flag_count():
+    assert "flag_count" not in incident_projection(None, admin=True)
+    assert parse_fields("id,flag_count", admin=True) == ["id", "flag_count"]
+
+
+def test_pages_walk_through_all_documents_without_overlap():
+    docs = [{"id": i, "datetime": f"2026-01-0{1 + i // 3}T00:00:00+00:00", "lat": i} for i in range(7)]
+    collection = _FakeCollection(docs)
+
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            page, cursor = await fetch_incident_page(collection, {}, 3, cursor=cursor, fields=["lat"])
+            seen.extend(page)
+            if cursor is None:
+                return seen
+
+    seen = asyncio.run(walk())
+    assert [d["lat"] for d in seen] == [6, 5, 4, 3, 2, 1, 0]
+    assert all(set(d) == {"lat"} for d in seen)
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from rate_limit import RATE_LIMIT_RULES, MemoryRateLimitBackend, RateLimitMiddleware, gcra, match_rule
+
+
+def test_gcra_allows_a_burst_then_one_per_interval():
+    tat, now = None, 1000.0
+    results = []
+    for _ in range(4):
+        allowed, new_tat, retry_after = gcra(tat, now, limit=3, window_seconds=30)
+        results.append(allowed)
+        if allowed:
+            tat = new_tat
+    assert results == [True, True, False, False]
+    assert retry_after == 15
+    assert gcra(tat, now + 15, limit=3, window_seconds=30)[0]
+
+
+def test_no_rolling_window_admits_more_than_the_limit():
+    for rule in RATE_LIMIT_RULES:
+        tat, admitted = None, []
+        # One request per second for three windows.
+        for now in range(3 * rule.window_seconds):
+            allowed, new_tat, _ = gcra(tat, now, rule.limit, rule.window_seconds)
+            if allowed:
+                tat = new_tat
+                admitted.append(now)
+        busiest = max(
+            sum(1 for t in admitted if start <= t < start + rule.window_seconds) for start in admitted
+        )
+        assert busiest == rule.limit, rule.key
+
+
+def test_rules_match_with_or_without_trailing_slash():
+    assert match_rule("POST", "/api/report/").key == "report_incident"
+    assert match_rule("POST", "/api/report").key == "report_incident"
+    assert match_rule("POST", "/api/incidents/42/flag/").key == "flag_incident"
+    assert match_rule("POST", "/api/ai/chat/stream/").key == "ai_chat"
+    assert match_rule("GET", "/api/report/") is None
+    assert match_rule("POST", "/api/reports/") is None
+
+
+def test_memory_backend_evicts_idle_keys_and_stays_bounded(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("rate_limit.time.time", lambda: clock[0])
+    backend = MemoryRateLimitBackend(max_keys=3, sweep_seconds=0)
+
+    async def run():
+        for ip in range(5):
+            await backend.hit(f"k:{ip}", 5, 50)
+        bounded = len(backend)
+        clock[0] += 60
+        await backend.hit("k:new", 5, 50)
+        return bounded, len(backend)
+
+    assert asyncio.run(run()) == (3, 1)
+
+
+def test_middleware_rejects_before_the_handler_runs():
+    calls = []
+    app = FastAPI()
+
+    @app.post("/api/report/")
+    async def report():
+        calls.append(1)
+        return {"status": "success"}
+
+    app.add_middleware(RateLimitMiddleware, backend=MemoryRateLimitBackend())
+    client = TestClient(app)
+    statuses = [client.post("/api/report/", json={}).status_code for _ in range(6)]
+    assert statuses == [200] * 3 + [429] * 3
+    assert len(calls) == 3
+    rejected = client.post("/api/report/", json={})
+    assert rejected.json() == {"status": "error", "message": "Report rate limit exceeded (5/hour)."}
+    assert int(rejected.headers["retry-after"]) > 0
+    assert client.post("/api/report/", json={}, headers={"X-Forwarded-For": "10.0.0.9"}).status_code == 200
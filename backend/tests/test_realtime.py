@@ -0,0 +1,126 @@
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import asyncio
+import json
+
+from realtime import ConnectionManager, SubscriptionFilter
+
+
+class _FakeWebSocket:
+    def __init__(self, gate: asyncio.Event | None = None):
+        self.sent: list[str] = []
+        self.gate = gate
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+def test_slow_client_does_not_block_fast_clients_and_is_coalesced():
+    async def scenario():
+        manager = ConnectionManager(max_queue=2, send_timeout=5)
+        fast, gate = _FakeWebSocket(), asyncio.Event()
+        slow = _FakeWebSocket(gate)
+        await manager.connect(fast)
+        await manager.connect(slow)
+
+        for i in range(5):
+            await manager.broadcast({"type": "new_incident", "incident": {"id": i}})
+            await asyncio.sleep(0.001)
+        gate.set()
+        await asyncio.sleep(0.01)
+        return fast, slow, manager
+
+    fast, slow, manager = asyncio.run(scenario())
+    assert [json.loads(t)["incident"]["id"] for t in fast.sent] == [0, 1, 2, 3, 4]
+    assert [json.loads(t).get("incident", {}).get("id") for t in slow.sent] == [0, None, 4]
+    assert json.loads(slow.sent[1]) == {"type": "resync_required"}
+    assert manager.subscribers[slow].coalesced >= 1
+
+
+def test_stalled_client_is_disconnected():
+    async def scenario():
+        manager = ConnectionManager(max_queue=4, send_timeout=0.01)
+        stalled = _FakeWebSocket(asyncio.Event())
+        await manager.connect(stalled)
+        await manager.broadcast({"type": "incident_removed", "incident_id": 1})
+        await asyncio.sleep(0.05)
+        return manager, stalled
+
+    manager, stalled = asyncio.run(scenario())
+    assert manager.active_connections == []
+    assert stalled.closed
+
+
+def test_events_from_other_workers_reach_local_sockets():
+    from realtime_bus import BroadcastBus
+
+    class LoopbackBus(BroadcastBus):
+        """Stands in for a shared broker connecting two workers."""
+
+        peers: list = []
+
+        def __init__(self):
+            super().__init__()
+            LoopbackBus.peers.append(self)
+
+        async def publish(self, message):
+            for peer in LoopbackBus.peers:
+                peer._deliver(message)
+
+    async def scenario():
+        worker_a, worker_b = ConnectionManager(), ConnectionManager()
+        await worker_a.start(LoopbackBus())
+        await worker_b.start(LoopbackBus())
+        socket_b = _FakeWebSocket()
+        await worker_b.connect(socket_b)
+        await worker_a.broadcast({"type": "new_incident", "incident": {"id": 9}})
+        await asyncio.sleep(0.01)
+        return socket_b
+
+    socket_b = asyncio.run(scenario())
+    assert [json.loads(t)["incident"]["id"] for t in socket_b.sent] == [9]
+
+
+def test_regional_subscriptions_only_receive_matching_events():
+    async def scenario():
+        manager = ConnectionManager()
+        kyiv, khartoum, everyone = _FakeWebSocket(), _FakeWebSocket(), _FakeWebSocket()
+        for ws in (kyiv, khartoum, everyone):
+            await manager.connect(ws)
+        manager.subscribe(
+            kyiv, SubscriptionFilter.from_message({"center": [50.45, 30.52], "radius_km": 50})
+        )
+        manager.subscribe(
+            khartoum,
+            SubscriptionFilter.from_message({"bbox": [32, 15, 33, 16], "min_severity": "high"}),
+        )
+        events = [
+            {"type": "new_incident", "incident": {"id": 1, "lat": 50.4, "lng": 30.5, "severity": "low"}},
+            {"type": "new_incident", "incident": {"id": 2, "lat": 15.5, "lng": 32.5, "severity": "medium"}},
+            {"type": "new_incident", "incident": {"id": 3, "lat": 15.5, "lng": 32.5, "severity": "critical"}},
+            {"type": "incident_removed", "incident_id": 2, "lat": 15.5, "lng": 32.5},
+        ]
+        for event in events:
+            await manager.broadcast(event)
+            await asyncio.sleep(0.001)
+        return kyiv, khartoum, everyone
+
+    def ids(ws):
+        return [json.loads(t).get("incident", {}).get("id") or json.loads(t)["incident_id"] for t in ws.sent]
+
+    kyiv, khartoum, everyone = asyncio.run(scenario())
+    assert ids(kyiv) == [1]
+    assert ids(khartoum) == [3, 2]
+    assert ids(everyone) == [1, 2, 3, 2]
@@ -0,0 +1,50 @@
+from response_cache import ResponseCache
+
+
+def test_exact_hits_are_scoped_to_agent_type():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    cache.put("medical", "How do I stop bleeding?", "Apply pressure.")
+
+    assert cache.get("medical", "how do i stop   BLEEDING?") == "Apply pressure."
+    assert cache.get("medical", "how do I stop bleding?") is None
+    assert cache.get("general", "How do I stop bleeding?") is None
+
+
+def test_negation_is_part_of_the_key():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60, exact_agents=frozenset())
+    cache.put("general", "What if the person is not breathing?", "Start CPR.")
+    assert cache.get("general", "What if the person is breathing?") is None
+
+
+def test_word_order_is_ignored_except_for_exact_agents():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    cache.put("general", "curfew hours in khartoum", "A")
+    cache.put("medical", "burn first aid", "B")
+
+    assert cache.get("general", "khartoum curfew hours in") == "A"
+    assert cache.get("general", "curfew hour in khartoum") is None
+    assert cache.get("medical", "first aid burn") is None
+    assert cache.get("medical", "Burn first  aid") == "B"
+
+
+def test_size_bound_and_invalidation():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.put("general", "first question", "1")
+    cache.put("general", "second question", "2")
+    cache.put("medical", "third question", "3")
+    assert len(cache) == 2
+    assert cache.get("general", "first question") is None
+
+    cache.invalidate("medical")
+    assert cache.get("medical", "third question") is None
+    assert cache.get("general", "second question") == "2"
+
+
+def test_entries_expire(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("response_cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(max_entries=10, ttl_seconds=5)
+    cache.put("general", "curfew hours", "A")
+    now[0] = 10
+    assert cache.get("general", "curfew hours") is None
+    assert len(cache) == 0
@@ -0,0 +1,42 @@
+import asyncio
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "safeguard_test")
+
+import pytest
+
+from storage import LocalStorage, create_storage
+
+
+def test_local_storage_round_trip(tmp_path):
+    storage = LocalStorage(str(tmp_path / "objects"))
+
+    async def run():
+        await storage.init()
+        result = await storage.put("safeguard/uploads/a.png", b"png-bytes", "image/png")
+        return result, await storage.get("safeguard/uploads/a.png")
+
+    result, (data, content_type) = asyncio.run(run())
+    assert result == {"path": "safeguard/uploads/a.png", "size": 9}
+    assert data == b"png-bytes"
+    assert content_type == "image/png"
+    assert not list((tmp_path / "objects").rglob("*.part"))
+
+
+def test_local_storage_rejects_paths_outside_root(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    with pytest.raises(ValueError):
+        asyncio.run(storage.put("../escape.png", b"x", "image/png"))
+
+
+def test_backend_is_selected_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("STORAGE_LOCAL_DIR", str(tmp_path))
+    monkeypatch.setenv("STORAGE_MAX_CONCURRENCY", "3")
+    storage = create_storage()
+    assert isinstance(storage, LocalStorage)
+    assert storage.max_concurrency == 3
+    monkeypatch.setenv("STORAGE_BACKEND", "s3")
+    with pytest.raises(ValueError):
+        create_storage()
@@ -0,0 +1,50 @@
+import asyncio
+
+from task_store import MemoryTaskStore
+
+
+def test_memory_task_store_evicts_least_recently_used():
+    store = MemoryTaskStore(max_entries=2, ttl_seconds=60)
+
+    async def scenario():
+        await store.create("a", {"status": "processing"})
+        await store.create("b", {"status": "processing"})
+        await store.get("a")
+        await store.create("c", {"status": "processing"})
+        return await store.get("a"), await store.get("b"), await store.get("c")
+
+    a, b, c = asyncio.run(scenario())
+    assert a is not None and c is not None
+    assert b is None
+    assert len(store) == 2
+
+
+def test_memory_task_store_expires_entries(monkeypatch):
+    store = MemoryTaskStore(max_entries=10, ttl_seconds=5)
+    now = [1000.0]
+    monkeypatch.setattr("task_store.time.monotonic", lambda: now[0])
+
+    asyncio.run(store.create("a", {"status": "processing"}))
+    asyncio.run(store.update("a", {"status": "success"}))
+    assert asyncio.run(store.get("a"))["status"] == "success"
+    now[0] += 6
+    assert asyncio.run(store.get("a")) is None
+    assert len(store) == 0
+
+
+def test_memory_task_store_sweeps_expired_entries_out_of_order(monkeypatch):
+    store = MemoryTaskStore(max_entries=10, ttl_seconds=5, sweep_seconds=0)
+    now = [1000.0]
+    monkeypatch.setattr("task_store.time.monotonic", lambda: now[0])
+
+    async def scenario():
+        await store.create("old", {"status": "processing"})
+        now[0] += 4
+        await store.create("fresh", {"status": "processing"})
+        await store.get("old")  # moves "old" behind "fresh" without extending it
+        now[0] += 2
+        await store.create("new", {"status": "processing"})
+        await store.update("old", {"status": "success"})
+
+    asyncio.run(scenario())
+    assert set(store._tasks) == {"fresh", "new"}
@@ -0,0 +1,50 @@
+import os
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """Short-lived LRU cache of resolved users keyed by user id (the token ``sub``).
+
+    Entries are dropped explicitly on logout and on password or role changes;
+    the TTL bounds how long other workers keep serving a stale copy.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str) -> dict | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return dict(entry[1])
+
+    def put(self, user_id: str, user: dict) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str | None = None) -> None:
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+
+def create_user_cache() -> UserCache:
+    return UserCache(
+        max_entries=int(os.environ.get("AUTH_USER_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.environ.get("AUTH_USER_CACHE_TTL_SECONDS", "30")),
+    )